@@ -0,0 +1,297 @@
+import compact
+import numpy as np
+from compact import CompactState, is_goal
+from environment import INFEASIBLE, SPACE, ACTOR, WALL, BOX, TARGET, BOX_ON_TARGET, ACTOR_ON_TARGET, \
+    BASIC_REWARD, actions
+
+# Accelerated engine: same functions and results as compact.py, with the per-move rules run as
+# Numba-compiled kernels over a flat int8 status grid (the padded environment.Level grid with
+# the boxes and the actor drawn in) that every state carries. Without Numba the module falls
+# back to compact.py's pure-Python functions, so engine='accel' always works.
+
+try:
+    from numba import njit
+    JIT = True
+except ImportError:
+    JIT = False
+
+    def njit(*args, **kwargs):
+        # used as @njit(cache=True): return the function uncompiled
+        return lambda fn: fn
+
+directions = list(actions)
+# kernels only see plain global scalars
+R_SPACE, R_INFEASIBLE, R_OFF_TARGET, R_ON_TARGET, R_ON_SPACE, R_BOX_BY_BOX, R_BOX_BY_WALL = (float(BASIC_REWARD[k]) for k in
+    ('SPACE', 'INFEASIBLE', 'OFF_TARGET', 'ON_TARGET', 'ON_SPACE', 'BOX_BY_BOX', 'BOX_BY_WALL'))
+# feasible action names for every 4-bit mask of feasible directions
+_feasible_lists = [[a for i, a in enumerate(directions) if mask >> i & 1] for mask in range(16)]
+
+class GridState(CompactState):
+    __slots__ = ('grid', 'moves', 'dead')
+
+    def __init__(self, level, actor, boxes, key=None, grid=None, arrays=None):
+        super().__init__(level, actor, boxes, key)
+        self.grid = _draw(level, actor, boxes) if grid is None else grid
+        # per-level kernel arguments, shared by every state of the level
+        self.moves, self.dead = _level_arrays(level) if arrays is None else arrays
+
+def _draw(level, actor, boxes):
+    grid = level.grid.copy()
+    for b in boxes:
+        grid[b] = BOX_ON_TARGET if grid[b] == TARGET else BOX
+    grid[actor] = ACTOR_ON_TARGET if grid[actor] == TARGET else ACTOR
+    return grid
+
+def _level_arrays(level):
+    # move deltas in environment.actions order, dead squares
+    return np.array([level.moves[a] for a in directions], dtype=np.int64), np.array(level.dead, dtype=np.bool_)
+
+@njit(cache=True)
+def _occupied(s):
+    return s == WALL or s == INFEASIBLE or s == BOX or s == BOX_ON_TARGET
+
+@njit(cache=True)
+def _blocked(s):
+    return s == WALL or s == INFEASIBLE
+
+@njit(cache=True)
+def _feasible(grid, actor, d):
+    s = grid[actor + d]
+    if s == SPACE or s == TARGET:
+        return True
+    if s == BOX or s == BOX_ON_TARGET:
+        return not _occupied(grid[actor + 2 * d])
+    return False
+
+@njit(cache=True)
+def _feasible_mask(grid, actor, moves):
+    mask = 0
+    for i in range(4):
+        if _feasible(grid, actor, moves[i]):
+            mask |= 1 << i
+    return mask
+
+@njit(cache=True)
+def _step(grid, actor, d):
+    # returns the new grid; the caller updates the box set if a box was on actor + d
+    new_grid = grid.copy()
+    nxt = actor + d
+    new_grid[actor] = TARGET if grid[actor] == ACTOR_ON_TARGET else SPACE
+    s = grid[nxt]
+    if s == BOX or s == BOX_ON_TARGET:
+        beyond = nxt + d
+        new_grid[beyond] = BOX_ON_TARGET if grid[beyond] == TARGET else BOX
+        s = TARGET if s == BOX_ON_TARGET else SPACE
+    new_grid[nxt] = ACTOR_ON_TARGET if s == TARGET else ACTOR
+    return new_grid
+
+@njit(cache=True)
+def _count_walls(grid, cell, moves):
+    count = 0
+    for i in range(4):
+        if grid[cell + moves[i]] == WALL:
+            count += 1
+    return count
+
+@njit(cache=True)
+def _move_reward(grid, actor, d, moves):
+    if not _feasible(grid, actor, d):
+        return R_INFEASIBLE
+    nxt = actor + d
+    s = grid[nxt]
+    if s == SPACE or s == TARGET:
+        return R_SPACE
+    reward = 0.0
+    beyond = nxt + d
+    if grid[beyond] == INFEASIBLE:
+        return reward + R_INFEASIBLE
+    t = grid[beyond]
+    if s == BOX_ON_TARGET:
+        # push box off target
+        if t == SPACE:
+            reward += R_OFF_TARGET
+        elif t == TARGET:
+            reward += R_ON_TARGET ** 2
+            wall_count = _count_walls(grid, beyond, moves)
+            if wall_count >= 2:
+                reward *= (wall_count - 1) * 1000
+            cell = beyond + d
+            while grid[cell] != INFEASIBLE and grid[cell] == TARGET:
+                reward *= 5
+                cell += d
+    elif s == BOX:
+        if t == WALL or t == BOX or t == BOX_ON_TARGET:
+            reward += R_INFEASIBLE
+        elif t == TARGET:
+            reward += R_ON_TARGET
+            cell = beyond + d
+            while grid[cell] != INFEASIBLE and grid[cell] == TARGET:
+                reward += R_ON_TARGET
+                cell += d
+        elif t == SPACE:
+            reward += R_ON_SPACE
+            after = grid[beyond + d]
+            if after == BOX:
+                reward += R_BOX_BY_BOX
+            elif after == WALL or after == INFEASIBLE:
+                reward += R_BOX_BY_WALL
+    return reward
+
+@njit(cache=True)
+def _immovable(grid, loc, moves):
+    # moves is UP, LEFT, DOWN, RIGHT; corners are (UP, RIGHT), (RIGHT, DOWN), (DOWN, LEFT), (LEFT, UP)
+    for k in range(4):
+        a1 = (0, 3, 2, 1)[k]
+        a2 = (3, 2, 1, 0)[k]
+        n1 = loc + moves[a1]
+        n2 = loc + moves[a2]
+        s1 = grid[n1]
+        s2 = grid[n2]
+        if _occupied(s1) and _occupied(s2):
+            if _blocked(s1) and _blocked(s2):
+                return True
+            for j in range(2):
+                n = n1 if j == 0 else n2
+                s = s1 if j == 0 else s2
+                a = a1 if j == 0 else a2
+                if s == BOX or s == BOX_ON_TARGET:
+                    # detect 2 box placement across the axis of a
+                    p = moves[1] if a == 0 or a == 2 else moves[0]
+                    loc_blocked = _occupied(grid[loc + p]) or _occupied(grid[loc - p])
+                    n_blocked = _occupied(grid[n + p]) or _occupied(grid[n - p])
+                    if loc_blocked and n_blocked:
+                        return True
+    return False
+
+@njit(cache=True)
+def _deadlock(grid, dead, actor, d, moves):
+    return _frozen(grid, dead, moves) or _wall_deadlock(grid, actor, d, moves)
+
+@njit(cache=True)
+def _frozen(grid, dead, moves):
+    for loc in range(len(grid)):
+        # boxes on targets never make a deadlock here
+        if grid[loc] != BOX:
+            continue
+        # static dead squares cover boxes stuck in corners or against target-free walls
+        if dead[loc]:
+            return True
+        # frozen against a neighboring box
+        near_box = False
+        for i in range(4):
+            s = grid[loc + moves[i]]
+            if s == BOX or s == BOX_ON_TARGET:
+                near_box = True
+        if near_box and _immovable(grid, loc, moves):
+            return True
+    return False
+
+@njit(cache=True)
+def _wall_deadlock(grid, actor, d, moves):
+    loc = actor + d
+    if grid[loc] == BOX and _blocked(grid[loc + d]):
+        p = moves[1] if d == moves[0] or d == moves[2] else moves[0]
+        cts = True
+        target_count = 0
+        box_count = 0
+        for sign in (-1, 1):
+            l = loc + sign * p
+            s = grid[l]
+            while not _blocked(s):
+                if s == TARGET:
+                    target_count += 1
+                elif s == BOX:
+                    box_count += 1
+                if not _blocked(grid[l + d]) and not _blocked(grid[l - d]):
+                    cts = False
+                l += sign * p
+                s = grid[l]
+        if cts and box_count + 1 > target_count:
+            return True
+    return False
+
+def from_state(state):
+    state = compact.from_state(state) if not isinstance(state, CompactState) else state
+    return GridState(state.level, state.actor, state.boxes, state.key)
+
+def to_state(state):
+    return compact.to_state(state)
+
+def get_location_status(state, cell):
+    return int(state.grid[cell])
+
+def step(state, action):
+    level = state.level
+    d = level.moves[action]
+    next_position = state.actor + d
+    boxes = state.boxes
+    key = state.key ^ level.actor_keys[state.actor] ^ level.actor_keys[next_position]
+    if next_position in boxes:
+        next_two_position = next_position + d
+        boxes = boxes.difference((next_position,)).union((next_two_position,))
+        key ^= level.box_keys[next_position] ^ level.box_keys[next_two_position]
+    return GridState(level, next_position, boxes, key, _step(state.grid, state.actor, d), (state.moves, state.dead))
+
+def get_feasible_actions(state):
+    return list(_feasible_lists[_feasible_mask(state.grid, state.actor, state.moves)])
+
+def is_feasible_action(state, action):
+    return _feasible(state.grid, state.actor, state.level.moves[action])
+
+def count_walls(state, cell):
+    return _count_walls(state.grid, cell, state.moves)
+
+def get_reward(state, action, new_state):
+    reward = get_move_reward(state, action, new_state)
+
+    if is_goal(new_state):
+        reward += BASIC_REWARD['GOAL']
+    elif is_deadlock(new_state, action):
+        reward += BASIC_REWARD['DEADLOCK']
+
+    return reward
+
+def get_transitions(state):
+    """
+    :return: list of (action, successor, reward, goal, deadlock) for every feasible action of state,
+        as compact.get_transitions (walks share one goal and frozen-box check of the current layout)
+    """
+    result = []
+    layout = None
+    for action in get_feasible_actions(state):
+        d = state.level.moves[action]
+        new_state = step(state, action)
+        reward = _move_reward(state.grid, state.actor, d, state.moves)
+        if new_state.boxes is state.boxes:
+            if layout is None:
+                layout = is_goal(state), _frozen(state.grid, state.dead, state.moves)
+            goal = layout[0]
+            deadlock = not goal and (layout[1] or _wall_deadlock(new_state.grid, new_state.actor, d, state.moves))
+        else:
+            goal = is_goal(new_state)
+            deadlock = not goal and is_deadlock(new_state, action)
+        if goal:
+            reward += BASIC_REWARD['GOAL']
+        elif deadlock:
+            reward += BASIC_REWARD['DEADLOCK']
+        result.append((action, new_state, reward, goal, deadlock))
+    return result
+
+def get_move_reward(state, action, new_state):
+    return _move_reward(state.grid, state.actor, state.level.moves[action], state.moves)
+
+def is_deadlock(state, action):
+    return _deadlock(state.grid, state.dead, state.actor, state.level.moves[action], state.moves)
+
+def is_immovable(state, loc):
+    return _immovable(state.grid, loc, state.moves)
+
+if not JIT:
+    # reference implementation: kernels over NumPy scalars would be slower than compact.py
+    get_location_status, step, get_feasible_actions, is_feasible_action, count_walls, get_move_reward, \
+        is_deadlock, is_immovable, get_transitions = compact.get_location_status, compact.step, \
+        compact.get_feasible_actions, compact.is_feasible_action, compact.count_walls, compact.get_move_reward, \
+        compact.is_deadlock, compact.is_immovable, compact.get_transitions
+
+    def from_state(state):
+        return compact.from_state(state) if not isinstance(state, CompactState) else state
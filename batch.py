@@ -0,0 +1,271 @@
+import compact
+import numpy as np
+from functools import lru_cache
+from environment import INFEASIBLE, SPACE, ACTOR, WALL, BOX, TARGET, BOX_ON_TARGET, ACTOR_ON_TARGET, \
+    BASIC_REWARD, actions
+
+# Batched engine: B states of one level stepped together with NumPy indexing instead of
+# Python branching per state. A batch is the actor cell of every state plus a (B, size)
+# box occupancy array over the padded flat grid of environment.Level. Actions are
+# integer indices into environment.actions. For feasible actions every function gives
+# exactly what the scalar function of the same name in environment.py/compact.py gives;
+# an infeasible action leaves its state unchanged and earns the INFEASIBLE reward.
+
+directions = list(actions)
+
+def _table(statuses):
+    # lookup table for membership of a status in statuses, indexed by status - INFEASIBLE
+    table = np.zeros(ACTOR_ON_TARGET - INFEASIBLE + 1, dtype=bool)
+    table[[s - INFEASIBLE for s in statuses]] = True
+    return table
+
+FREE = _table((SPACE, TARGET))
+ANY_BOX = _table((BOX, BOX_ON_TARGET))
+OCCUPIED = _table(compact.OCCUPIED)
+BLOCKED = _table(compact.BLOCKED)
+
+class BatchState:
+    def __init__(self, level, actor, boxes):
+        self.level = level
+        self.actor = actor # (B,) actor cells
+        self.boxes = boxes # (B, size) bool box occupancy
+
+    def __len__(self):
+        return len(self.actor)
+
+    @classmethod
+    def from_states(cls, states):
+        """:param states: environment.State or compact.CompactState objects of one level"""
+        states = [compact.from_state(s) if not isinstance(s, compact.CompactState) else s for s in states]
+        level = states[0].level
+        boxes = np.zeros((len(states), level.size), dtype=bool)
+        for i, s in enumerate(states):
+            boxes[i, list(s.boxes)] = True
+        return cls(level, np.array([s.actor for s in states], dtype=np.int64), boxes)
+
+    @classmethod
+    def repeat(cls, state, n):
+        """:return: batch of n copies of state"""
+        batch = cls.from_states([state])
+        return cls(batch.level, np.repeat(batch.actor, n), np.repeat(batch.boxes, n, axis=0))
+
+    def to_state(self, i):
+        """:return: compact.CompactState of the i-th state"""
+        return compact.CompactState(self.level, int(self.actor[i]), frozenset(np.flatnonzero(self.boxes[i]).tolist()))
+
+    def status(self):
+        """:return: (B, size) int8 location status of every cell, as get_location_status"""
+        grid = self.level.grid
+        status = np.broadcast_to(grid, self.boxes.shape).copy()
+        on_target = grid == TARGET
+        status[self.boxes & on_target] = BOX_ON_TARGET
+        status[self.boxes & ~on_target] = BOX
+        rows = np.arange(len(self))
+        status[rows, self.actor] = np.where(on_target[self.actor], ACTOR_ON_TARGET, ACTOR)
+        return status
+
+def _deltas(level, action):
+    return np.array([level.moves[a] for a in directions], dtype=np.int64)[action]
+
+def _at(status, cells):
+    # status of cells (one per row), cells outside the padded grid count as INFEASIBLE
+    size = status.shape[1]
+    inside = (cells >= 0) & (cells < size)
+    values = status[np.arange(len(status)), np.minimum(np.maximum(cells, 0), size - 1)]
+    return np.where(inside, values, INFEASIBLE)
+
+@lru_cache(maxsize=None)
+def _shift_index(size, d):
+    return np.minimum(np.maximum(np.arange(size) + d, 0), size - 1)
+
+def _shift(status, d):
+    # status of the cell at offset d from every cell; border cells only ever read the border
+    return status[:, _shift_index(status.shape[1], d)]
+
+def get_feasible_mask(batch, status=None):
+    """:return: (B, 4) bool array, whether each action of environment.actions is feasible"""
+    status = batch.status() if status is None else status
+    mask = np.zeros((len(batch), len(directions)), dtype=bool)
+    for i in range(len(directions)):
+        mask[:, i] = is_feasible_action(batch, np.full(len(batch), i), status)
+    return mask
+
+def is_feasible_action(batch, action, status=None):
+    status = batch.status() if status is None else status
+    d = _deltas(batch.level, action)
+    next_status = _at(status, batch.actor + d)
+    beyond_status = _at(status, batch.actor + 2 * d)
+    return FREE[next_status - INFEASIBLE] | \
+        (ANY_BOX[next_status - INFEASIBLE] & ~OCCUPIED[beyond_status - INFEASIBLE])
+
+def step(batch, action, status=None):
+    """:return: batch after every state took its action (infeasible actions leave the state as is)"""
+    d = _deltas(batch.level, action)
+    feasible = is_feasible_action(batch, action, status)
+    next_position = batch.actor + d
+    rows = np.flatnonzero(feasible)
+    pushed = rows[batch.boxes[rows, next_position[rows]]]
+    boxes = batch.boxes.copy()
+    boxes[pushed, next_position[pushed]] = False
+    boxes[pushed, next_position[pushed] + d[pushed]] = True
+    return BatchState(batch.level, np.where(feasible, next_position, batch.actor), boxes)
+
+def _run_length(status, start, d, value, active):
+    # number of consecutive cells equal to value from start in steps of d (the border ends every run)
+    n = np.zeros(len(status), dtype=np.int64)
+    cells = start.copy()
+    active = active & (_at(status, cells) == value)
+    while active.any():
+        n += active
+        cells += d
+        active &= _at(status, cells) == value
+    return n
+
+def get_move_reward(batch, action, status=None):
+    """:return: (B,) reward of each move, without the goal/deadlock terms of the resulting state"""
+    status = batch.status() if status is None else status
+    level = batch.level
+    d = _deltas(level, action)
+    feasible = is_feasible_action(batch, action, status)
+    next_position = batch.actor + d
+    beyond = next_position + d
+    next_status = _at(status, next_position)
+    beyond_status = _at(status, beyond)
+
+    reward = np.full(len(batch), float(BASIC_REWARD['INFEASIBLE']))
+    reward[feasible & FREE[next_status - INFEASIBLE]] = BASIC_REWARD['SPACE']
+
+    # push box off target
+    off = feasible & (next_status == BOX_ON_TARGET)
+    reward[off & (beyond_status == SPACE)] = BASIC_REWARD['OFF_TARGET']
+    onto = off & (beyond_status == TARGET)
+    if onto.any():
+        wall_count = sum((_at(status, beyond + m) == WALL).astype(np.int64) for m in level.moves.values())
+        value = np.full(len(batch), float(BASIC_REWARD['ON_TARGET'] ** 2))
+        value = np.where(wall_count >= 2, value * (wall_count - 1) * 1000, value)
+        value *= 5.0 ** _run_length(status, beyond + d, d, TARGET, onto)
+        reward[onto] = value[onto]
+
+    on = feasible & (next_status == BOX)
+    onto = on & (beyond_status == TARGET)
+    if onto.any():
+        run = _run_length(status, beyond + d, d, TARGET, onto)
+        reward[onto] = (BASIC_REWARD['ON_TARGET'] * (1 + run))[onto]
+    onto = on & (beyond_status == SPACE)
+    after = _at(status, beyond + d)
+    reward[onto] = BASIC_REWARD['ON_SPACE']
+    reward[onto & (after == BOX)] += BASIC_REWARD['BOX_BY_BOX']
+    reward[onto & BLOCKED[after - INFEASIBLE]] += BASIC_REWARD['BOX_BY_WALL']
+    return reward
+
+def is_goal(batch):
+    return ~(batch.boxes & (batch.level.grid != TARGET)).any(axis=1)
+
+def is_immovable(level, status):
+    """:return: (B, size) bool array, whether a box on each cell would be immovable (is_immovable)"""
+    moves = level.moves
+    occupied = OCCUPIED[status - INFEASIBLE]
+    blocked = BLOCKED[status - INFEASIBLE]
+    box = ANY_BOX[status - INFEASIBLE]
+    perpendicular = {a: ('LEFT', 'RIGHT') if a in ('UP', 'DOWN') else ('UP', 'DOWN') for a in moves}
+
+    def frozen_pair(a):
+        # neighbor in direction a is a box, and both it and the cell are blocked across the axis of a
+        m = moves[a]
+        loc_blocked = _shift(occupied, moves[perpendicular[a][0]]) | _shift(occupied, moves[perpendicular[a][1]])
+        n_blocked = _shift(occupied, m + moves[perpendicular[a][0]]) | _shift(occupied, m + moves[perpendicular[a][1]])
+        return _shift(box, m) & loc_blocked & n_blocked
+
+    immovable = np.zeros(status.shape, dtype=bool)
+    for a1, a2 in [('UP', 'RIGHT'), ('RIGHT', 'DOWN'), ('DOWN', 'LEFT'), ('LEFT', 'UP')]:
+        o = _shift(occupied, moves[a1]) & _shift(occupied, moves[a2])
+        walls = _shift(blocked, moves[a1]) & _shift(blocked, moves[a2])
+        immovable |= o & (walls | frozen_pair(a1) | frozen_pair(a2))
+    return immovable
+
+def is_deadlock(batch, action, status=None):
+    """
+    :param action: (B,) actions used to get to each state of batch
+    """
+    status = batch.status() if status is None else status
+    level = batch.level
+    moves = level.moves
+    loose = batch.boxes & (level.grid != TARGET)
+    dead = (loose & np.array(level.dead)).any(axis=1)
+
+    # frozen against a neighboring box
+    near_box = np.zeros(status.shape, dtype=bool)
+    for m in moves.values():
+        near_box |= _shift(batch.boxes, m)
+    candidates = loose & near_box
+    rows = np.flatnonzero(candidates.any(axis=1) & ~dead)
+    if len(rows):
+        dead[rows] = (candidates[rows] & is_immovable(level, status[rows])).any(axis=1)
+
+    # box pushed against a wall along a line of walls without enough targets
+    d = _deltas(level, action)
+    loc = batch.actor + d
+    rule = ~dead & (_at(status, loc) == BOX) & BLOCKED[_at(status, loc + d) - INFEASIBLE]
+    if rule.any():
+        perp = np.where(np.abs(d) == 1, level.width, 1)
+        cts = rule.copy()
+        target_count = np.zeros(len(batch), dtype=np.int64)
+        box_count = np.zeros(len(batch), dtype=np.int64)
+        for p in (-perp, perp):
+            l = loc + p
+            active = rule.copy()
+            while True:
+                s = _at(status, l)
+                active &= ~BLOCKED[s - INFEASIBLE]
+                if not active.any():
+                    break
+                target_count += active & (s == TARGET)
+                box_count += active & (s == BOX)
+                open_sides = ~BLOCKED[_at(status, l + d) - INFEASIBLE] & ~BLOCKED[_at(status, l - d) - INFEASIBLE]
+                cts &= ~(active & open_sides)
+                l = l + p
+        dead |= cts & (box_count + 1 > target_count)
+    return dead
+
+def batch_step(batch, action):
+    """
+    Steps every state of batch with its action.
+    :param action: (B,) action indices into environment.actions
+    :return: (next batch, (B,) rewards as get_reward, (B,) done, (B,) deadlock); done is goal or deadlock
+    """
+    action = np.asarray(action, dtype=np.int64)
+    status = batch.status()
+    move_reward = get_move_reward(batch, action, status)
+    new_batch = step(batch, action, status)
+    goal = is_goal(new_batch)
+    deadlock = ~goal & is_deadlock(new_batch, action)
+    reward = move_reward + np.where(goal, BASIC_REWARD['GOAL'], np.where(deadlock, BASIC_REWARD['DEADLOCK'], 0))
+    return new_batch, reward, goal | deadlock, deadlock
+
+def random_rollouts(state, n, length, rng=None):
+    """
+    Runs n random-policy rollouts of up to length moves from state at once; finished rollouts stop.
+    :return: (final batch, (n,) total rewards, (n,) moves taken, (n,) whether each rollout solved the level)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    batch = BatchState.repeat(state, n)
+    total = np.zeros(n)
+    moves = np.zeros(n, dtype=np.int64)
+    done = np.zeros(n, dtype=bool)
+    solved = np.zeros(n, dtype=bool)
+    for _ in range(length):
+        rows = np.flatnonzero(~done)
+        if not len(rows):
+            break
+        active = BatchState(batch.level, batch.actor[rows], batch.boxes[rows])
+        mask = get_feasible_mask(active)
+        # uniform choice among the feasible actions (action 0, a no-op, if there is none)
+        choice = np.argmax(rng.random(mask.shape) * mask, axis=1)
+        new_batch, reward, finished, deadlock = batch_step(active, choice)
+        batch.actor[rows] = new_batch.actor
+        batch.boxes[rows] = new_batch.boxes
+        total[rows] += reward
+        moves[rows] += 1
+        solved[rows] = finished & ~deadlock
+        done[rows] = finished
+    return batch, total, moves, solved
@@ -0,0 +1,500 @@
+import batch
+import compact
+import environment
+import generator
+import heuristics
+import argparse
+import glob
+import json
+import numpy as np
+import platform
+import random
+import sys
+import tracemalloc
+from collections import deque
+from parallel import learn_parallel
+from qlearning import QLearner, get_engine, get_transitions_separately
+from search import Solver
+from time import perf_counter
+
+BUNDLED_LEVELS = sorted(glob.glob("sokoban-*.txt"))
+
+def load_level(path):
+    with open(path, 'r') as f:
+        return environment.State.from_config("".join(f.readlines()))
+
+def run_learner(init_state, episodes, **options):
+    """
+    Trains a fresh QLearner on init_state.
+    :return: dict with episodes run, solution length (0 if unsolved) and wall time in ms
+    """
+    t0 = perf_counter()
+    qlearner = QLearner(init_state, **options)
+    n, _ = qlearner.learn(episodes, display=False)
+    t1 = perf_counter()
+    return {'episodes': qlearner.episodes, 'solution_length': n, 'time_ms': (t1 - t0) * 1000}
+
+def compare(levels, episodes, variants):
+    """
+    Prints episodes-to-solve, solution length and wall time of each learner variant on each level.
+    :param variants: mapping of variant name to QLearner keyword arguments
+    """
+    print(f"{'level':<18}{'variant':<16}{'episodes':>10}{'length':>10}{'time_ms':>12}")
+    for path in levels:
+        init_state = load_level(path)
+        for name, options in variants.items():
+            r = run_learner(init_state, episodes, **options)
+            print(f"{path:<18}{name:<16}{r['episodes']:>10}{r['solution_length']:>10}{r['time_ms']:>12.0f}")
+
+def compare_solvers(levels, episodes, engine):
+    """
+    Prints solution length and latency of Q-learning, A* and IDA* on each level.
+    """
+    print(f"{'level':<18}{'solver':<12}{'length':>10}{'expanded':>10}{'time_ms':>12}")
+    for path in levels:
+        init_state = load_level(path)
+        r = run_learner(init_state, episodes, engine=engine)
+        print(f"{path:<18}{'qlearning':<12}{r['solution_length']:>10}{'-':>10}{r['time_ms']:>12.0f}")
+        for method in ['astar', 'idastar', 'bidirectional']:
+            t0 = perf_counter()
+            solver = Solver(init_state)
+            n, _ = getattr(solver, method)()
+            t1 = perf_counter()
+            print(f"{path:<18}{method:<12}{n:>10}{solver.expanded:>10}{(t1 - t0) * 1000:>12.0f}")
+
+def count_states(init_state, limit=200000):
+    """
+    Breadth-first search over push moves from init_state, merging states by canonical key.
+    :return: dict with the canonical states reached, the exact (actor cell, boxes) states they
+        stand for right after a push, and the primitive states (every actor cell of each region)
+    """
+    start = compact.from_state(init_state)
+    seen = {compact.canonical_key(start)}
+    exact = {start.key}
+    primitive = 0
+    queue = deque([start])
+    while queue and len(seen) < limit:
+        state = queue.popleft()
+        tree = compact.walk(state)
+        primitive += len(tree)
+        for box, action in compact.get_pushes(state, tree):
+            new_state = compact.push(state, box, action)
+            exact.add(new_state.key)
+            key = compact.canonical_key(new_state)
+            if key not in seen:
+                seen.add(key)
+                queue.append(new_state)
+    return {'canonical': len(seen), 'exact': len(exact), 'primitive': primitive, 'complete': not queue}
+
+def compare_states(levels, limit):
+    """
+    Prints how many states each keying distinguishes on each level, and canonical A* against exact A*.
+    """
+    print(f"{'level':<18}{'primitive':>11}{'exact':>9}{'canonical':>11}"
+          f"{'A* exp':>8}{'len':>6}{'canon exp':>11}{'len':>6}")
+    for path in levels:
+        init_state = load_level(path)
+        r = count_states(init_state, limit)
+        solvers = [Solver(init_state), Solver(init_state, canonical=True)]
+        lengths = [solver.astar()[0] for solver in solvers]
+        print(f"{path:<18}{r['primitive']:>11}{r['exact']:>9}{r['canonical']:>11}"
+              f"{solvers[0].expanded:>8}{lengths[0]:>6}{solvers[1].expanded:>11}{lengths[1]:>6}"
+              f"{'' if r['complete'] else '  (limit)'}")
+
+def compare_engines(levels, episodes, engines):
+    """
+    Trains the same seeded learner with every engine, checks they take identical trajectories and
+    prints their throughput.
+    """
+    print(f"{'level':<18}{'engine':<10}{'episodes':>10}{'length':>10}{'steps/s':>12}{'same':>6}")
+    for path in levels:
+        init_state = load_level(path)
+        reference = None
+        for engine in engines:
+            random.seed(0)
+            t0 = perf_counter()
+            qlearner = QLearner(init_state, engine=engine)
+            n, solution = qlearner.learn(episodes, display=False)
+            t1 = perf_counter()
+            run = (qlearner.episodes, qlearner.t, solution)
+            reference = reference or run
+            print(f"{path:<18}{engine:<10}{qlearner.episodes:>10}{n:>10}{(qlearner.t - 1) / (t1 - t0):>12.0f}"
+                  f"{'yes' if run == reference else 'NO':>6}")
+
+def compare_parallel(levels, episodes, engine, workers, sync_every, seeds):
+    """
+    Prints the time to the first solution of parallel learning with each number of workers, as medians over
+    seeds. time_ms is wall-clock; cpu_ms is the CPU time of the worker that found the solution, which is
+    the wall-clock time on a machine with a core per worker (on fewer cores the workers share them, so
+    time_ms grows with the number of workers). speedup compares cpu_ms with the first number of workers.
+    unshared counts the states that did not fit in the shared store.
+    """
+    print(f"{'level':<18}{'workers':>8}{'solved':>8}{'episodes':>10}{'time_ms':>12}{'cpu_ms':>12}{'speedup':>10}"
+          f"{'unshared':>10}")
+    for path in levels:
+        init_state = load_level(path)
+        baseline = None
+        for k in workers:
+            wall, cpu, solver_episodes, unshared = [], [], [], 0
+            for seed in range(seeds):
+                t0 = perf_counter()
+                n, _, results = learn_parallel(init_state, k, episodes, seed=100 * seed, engine=engine,
+                                               sync_every=sync_every)
+                wall.append(perf_counter() - t0)
+                unshared += sum(r['unshared_states'] for r in results)
+                first = next((r for r in results if r['solved']), None)
+                if first is not None:
+                    cpu.append(first['cpu_ms'])
+                    solver_episodes.append(first['episodes'])
+            cpu_ms = float(np.median(cpu)) if cpu else float('nan')
+            baseline = baseline or cpu_ms
+            print(f"{path:<18}{k:>8}{f'{len(cpu)}/{seeds}':>8}{np.median(solver_episodes) if cpu else 0:>10.0f}"
+                  f"{np.median(wall) * 1000:>12.0f}{cpu_ms:>12.0f}{baseline / cpu_ms:>10.2f}{unshared:>10}")
+
+def sample_states(init_state, n, length=200, seed=0, patience=1000):
+    """
+    :param patience: consecutive walks finding no new state after which fewer than n states are returned
+    :return: n distinct compact states visited by random walks from init_state, stopping at goals and deadlocks
+    """
+    rng = random.Random(seed)
+    start = compact.from_state(init_state)
+    states = {start.key: start}
+    stalled = 0
+    while len(states) < n and stalled < patience:
+        found = len(states)
+        state = start
+        for _ in range(length):
+            feasible = compact.get_feasible_actions(state)
+            if not feasible:
+                break
+            action = rng.choice(feasible)
+            state = compact.step(state, action)
+            states.setdefault(state.key, state)
+            if compact.is_goal(state) or compact.is_deadlock(state, action) or len(states) == n:
+                break
+        stalled = 0 if len(states) > found else stalled + 1
+    return list(states.values())
+
+def compare_transitions(levels, n, engines):
+    """
+    Prints state expansions/sec of separate feasibility, step, reward and deadlock calls against the
+    engine's fused get_transitions, on the same sample of states, after checking they agree.
+    """
+    print(f"{'level':<18}{'engine':<10}{'states':>8}{'separate/s':>12}{'fused/s':>12}{'speedup':>10}")
+    for path in levels:
+        sample = sample_states(load_level(path), n)
+        for name in engines:
+            env = get_engine(name)
+            states = [compact.to_state(s) for s in sample] if name == 'array' else [env.from_state(s) for s in sample]
+            for state in states[:100]:
+                separate, fused = get_transitions_separately(env, state), env.get_transitions(state)
+                assert [(a, s.key, r, g, d) for a, s, r, g, d in separate] == [(a, s.key, r, g, d) for a, s, r, g, d in fused]
+            timings = []
+            for expand in (get_transitions_separately, lambda env, state: env.get_transitions(state)):
+                t0 = perf_counter()
+                for state in states:
+                    expand(env, state)
+                timings.append(len(states) / (perf_counter() - t0))
+            print(f"{path:<18}{name:<10}{len(states):>8}{timings[0]:>12.0f}{timings[1]:>12.0f}{timings[1] / timings[0]:>10.2f}")
+
+def micro_workloads(path, n, episodes):
+    """
+    :return: dict of operation name -> (function, list of argument tuples it is called with), over the
+        distinct array states among n states visited by random walks on the level in path
+    """
+    with open(path, 'r') as f:
+        config = "".join(f.readlines())
+    init_state = environment.State.from_config(config)
+    states = [compact.to_state(s) for s in {s.key: s for s in sample_states(init_state, n)}.values()]
+    moves = [(s, a) for s in states for a in environment.get_feasible_actions(s)]
+    successors = [(s, a, environment.step(s, a)) for s, a in moves]
+    distance_table = heuristics.get_distance_table(init_state)
+
+    def learn():
+        random.seed(0)
+        np.random.seed(0)
+        QLearner(init_state, distance_table=distance_table).learn(episodes, display=False)
+
+    def heuristic(make):
+        # a fresh heuristic per run, so matchings cached by earlier runs are not reused
+        def run(*states):
+            h = make()
+            for s in states:
+                h.heuristic(s)
+        return run
+
+    return {
+        'from_config': (environment.State.from_config, [(config,)] * 100),
+        'step': (environment.step, moves),
+        'get_feasible_actions': (environment.get_feasible_actions, [(s,) for s in states]),
+        'get_reward': (environment.get_reward, successors),
+        'is_deadlock': (lambda s, a, t: environment.is_deadlock(t, a), successors),
+        'get_distance_table': (heuristics.get_distance_table, [(init_state,)]),
+        'EMMHeuristic.heuristic': (heuristic(lambda: heuristics.EMMHeuristic(distance_table)), [tuple(states)]),
+        'AgentBoxHeuristic.heuristic': (heuristic(lambda: heuristics.AgentBoxHeuristic(distance_table)), [tuple(states)]),
+        'QLearner.learn': (learn, [()]),
+    }
+
+def measure(fn, calls, repeat, min_time=0.2):
+    """
+    :param calls: list of argument tuples; the results are dropped, so peak memory is the working memory of a call
+    :param min_time: seconds each timed run lasts at least, going over calls as many times as needed
+    :return: (calls per second over the fastest of repeat runs, peak traced memory of one more pass in bytes)
+    """
+    def run(loops):
+        t0 = perf_counter()
+        for _ in range(loops):
+            for args in calls:
+                fn(*args)
+        return perf_counter() - t0
+
+    # like timeit's autorange: double the loops until a run is long enough to time reliably
+    loops = 1
+    elapsed = run(loops)
+    while elapsed < min_time:
+        loops *= 2
+        elapsed = run(loops)
+    best = min([elapsed] + [run(loops) for _ in range(repeat - 1)])
+    # tracing slows everything down, so memory is measured in a separate pass
+    tracemalloc.start()
+    try:
+        run(1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return loops * len(calls) / best, peak
+
+def run_micro(levels, n, episodes, repeat, baseline=None, threshold=0.25):
+    """
+    Times every hot-path operation on every level, printing ops/sec, peak memory and the change
+    against baseline (the results of an earlier run) when given.
+    :param threshold: relative slowdown or memory growth beyond which a result counts as a regression
+    :return: (results as {"level operation": {"ops_per_sec": ..., "peak_bytes": ...}}, list of regressed keys)
+    """
+    previous = {} if baseline is None else baseline['results']
+    results = {}
+    regressions = []
+    print(f"{'level':<18}{'operation':<30}{'ops/s':>12}{'peak_kb':>10}{'ops':>9}{'mem':>9}")
+    for path in levels:
+        for name, (fn, calls) in micro_workloads(path, n, episodes).items():
+            ops, peak = measure(fn, calls, repeat)
+            if name.endswith('.heuristic'):
+                # one call evaluates every sampled state
+                ops *= len(calls[0])
+            key = f"{path} {name}"
+            results[key] = {'ops_per_sec': ops, 'peak_bytes': peak}
+            line = f"{path:<18}{name:<30}{ops:>12.1f}{peak / 1024:>10.1f}"
+            if key in previous:
+                speed = ops / previous[key]['ops_per_sec'] - 1
+                growth = peak / max(previous[key]['peak_bytes'], 1) - 1
+                regressed = speed < -threshold or growth > threshold
+                line += f"{speed:>+9.1%}{growth:>+9.1%}{'  REGRESSION' if regressed else ''}"
+                if regressed:
+                    regressions.append(key)
+            print(line)
+    return results, regressions
+
+def run_scaling(sizes, box_counts, wall_density, episodes, n, engine, seed=0):
+    """
+    Prints time and peak memory of the distance-table build, heuristic evaluation (per state, over
+    n sampled states) and training with QLearner.learn on generated square levels of every size and box count,
+    then how each grows with the number of cells and boxes: the exponent k of a power law fitted on
+    a log-log scale (1: linear, 2: quadratic).
+    """
+    points = {} # operation -> list of (cells, boxes, seconds, peak bytes)
+    print(f"{'size':>6}{'floor':>7}{'boxes':>7}  {'operation':<30}{'time_us':>14}{'peak_kb':>12}")
+    for size in sizes:
+        for boxes in box_counts:
+            try:
+                config = generator.generate_level(size, size, boxes, wall_density, seed)
+            except ValueError as e:
+                print(f"{size:>6}{'':>7}{boxes:>7}  skipped: {e}")
+                continue
+            init_state = environment.State.from_config(config)
+            level = init_state.level
+            floor = sum(level.is_floor(cell) for cell in range(level.size))
+            distance_table = heuristics.get_distance_table(init_state)
+            states = sample_states(init_state, n)
+
+            def evaluate(make):
+                def run():
+                    h = make()
+                    for s in states:
+                        h.heuristic(s)
+                return run
+
+            def learn():
+                random.seed(seed)
+                np.random.seed(seed)
+                QLearner(init_state, engine=engine, distance_table=distance_table).learn(episodes, display=False)
+
+            for name, fn in (('get_distance_table', lambda: heuristics.get_distance_table(init_state)),
+                             ('EMMHeuristic.heuristic', evaluate(lambda: heuristics.EMMHeuristic(distance_table))),
+                             ('AgentBoxHeuristic.heuristic', evaluate(lambda: heuristics.AgentBoxHeuristic(distance_table))),
+                             ('QLearner.learn', learn)):
+                ops, peak = measure(fn, [()], 1, min_time=0.1)
+                if name.endswith('.heuristic'):
+                    ops *= len(states)
+                points.setdefault(name, []).append((size * size, boxes, 1 / ops, peak))
+                print(f"{size:>6}{floor:>7}{boxes:>7}  {name:<30}{1e6 / ops:>14.1f}{peak / 1024:>12.1f}")
+
+    def exponent(xs, ys):
+        return np.polyfit(np.log(xs), np.log(ys), 1)[0] if len(set(xs)) > 1 else np.nan
+
+    print(f"\ngrowth exponents (cells at {min(box_counts)} boxes, boxes at {max(sizes)}x{max(sizes)})")
+    print(f"{'operation':<30}{'time~cells':>12}{'mem~cells':>12}{'time~boxes':>12}{'mem~boxes':>12}")
+    for name, rows in points.items():
+        by_cells = [r for r in rows if r[1] == min(box_counts)]
+        by_boxes = [r for r in rows if r[0] == max(sizes) ** 2]
+        print(f"{name:<30}"
+              f"{exponent([r[0] for r in by_cells], [r[2] for r in by_cells]):>12.2f}"
+              f"{exponent([r[0] for r in by_cells], [r[3] for r in by_cells]):>12.2f}"
+              f"{exponent([r[1] for r in by_boxes], [r[2] for r in by_boxes]):>12.2f}"
+              f"{exponent([r[1] for r in by_boxes], [r[3] for r in by_boxes]):>12.2f}")
+
+def compare_rollouts(levels, n, length):
+    """
+    Prints random-rollout throughput (moves/sec) of the scalar compact engine against batch.py.
+    """
+    print(f"{'level':<18}{'rollouts':>10}{'scalar/s':>12}{'batch/s':>12}{'speedup':>10}")
+    for path in levels:
+        init_state = load_level(path)
+        state0 = compact.from_state(init_state)
+        t0 = perf_counter()
+        moves = 0
+        for _ in range(n):
+            state = state0
+            for _ in range(length):
+                action = random.choice(compact.get_feasible_actions(state))
+                new_state = compact.step(state, action)
+                compact.get_reward(state, action, new_state)
+                moves += 1
+                if compact.is_goal(new_state) or compact.is_deadlock(new_state, action):
+                    break
+                state = new_state
+        t1 = perf_counter()
+        scalar = moves / (t1 - t0)
+
+        t0 = perf_counter()
+        _, _, batch_moves, _ = batch.random_rollouts(init_state, n, length, np.random.default_rng(0))
+        t1 = perf_counter()
+        batched = batch_moves.sum() / (t1 - t0)
+        print(f"{path:<18}{n:>10}{scalar:>12.0f}{batched:>12.0f}{batched / scalar:>10.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("Benchmarks on the bundled levels")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    push = subparsers.add_parser("push-distance", help="EMM heuristic with walking vs push distances")
+    push.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    push.add_argument("--episodes", type=int, default=1000)
+    push.add_argument("--engine", choices=["array", "compact", "accel"], default="compact")
+
+    solvers = subparsers.add_parser("solvers", help="Q-learning vs A* vs IDA* vs bidirectional latency and solution length")
+    solvers.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    solvers.add_argument("--episodes", type=int, default=1000)
+    solvers.add_argument("--engine", choices=["array", "compact", "accel"], default="compact")
+
+    states = subparsers.add_parser("states", help="unique states with exact vs canonical (actor region) keys")
+    states.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    states.add_argument("--limit", type=int, default=200000, help="stop the enumeration after this many canonical states")
+
+    planning = subparsers.add_parser("planning", help="plain Q-learning vs prioritized sweeping")
+    planning.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    planning.add_argument("--episodes", type=int, default=1000)
+    planning.add_argument("--engine", choices=["array", "compact", "accel", "macro"], default="compact")
+    planning.add_argument("--planning-steps", type=int, nargs="+", default=[5, 20])
+
+    traces = subparsers.add_parser("traces", help="one-step Q-learning vs Q(lambda)")
+    traces.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    traces.add_argument("--episodes", type=int, default=1000)
+    traces.add_argument("--engine", choices=["array", "compact", "accel", "macro"], default="compact")
+    traces.add_argument("--trace-decay", type=float, nargs="+", default=[0.5, 0.9])
+
+    engines = subparsers.add_parser("engines", help="identical trajectories and steps/sec of each engine")
+    engines.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    engines.add_argument("--episodes", type=int, default=1000)
+    engines.add_argument("--engines", nargs="+", default=["array", "compact", "accel"])
+
+    parallel = subparsers.add_parser("parallel", help="time to first solution with 1..k asynchronous workers")
+    parallel.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    parallel.add_argument("--episodes", type=int, default=1000)
+    parallel.add_argument("--engine", choices=["array", "compact", "accel", "macro"], default="compact")
+    parallel.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parallel.add_argument("--sync-every", type=int, default=1)
+    parallel.add_argument("--seeds", type=int, default=5)
+
+    transitions = subparsers.add_parser("transitions", help="state expansions/sec with separate vs fused engine calls")
+    transitions.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    transitions.add_argument("--states", type=int, default=5000)
+    transitions.add_argument("--engines", nargs="+", default=["array", "compact", "accel"])
+
+    micro = subparsers.add_parser("micro", help="ops/sec and peak memory of the environment and heuristic hot paths, "
+                                                "optionally checked against a saved baseline")
+    micro.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    micro.add_argument("--states", type=int, default=500, help="random-walk states each operation runs on")
+    micro.add_argument("--episodes", type=int, default=1000, help="episode limit of the QLearner.learn run")
+    micro.add_argument("--repeat", type=int, default=5, help="timed runs per operation (the fastest counts)")
+    micro.add_argument("--save", help="write the results to this JSON baseline file")
+    micro.add_argument("--baseline", help="JSON baseline to compare against; exits with status 1 on a regression")
+    micro.add_argument("--threshold", type=float, default=0.25,
+                       help="relative slowdown or peak memory growth counted as a regression")
+
+    scaling = subparsers.add_parser("scaling", help="time and peak memory vs level size and box count on "
+                                                    "generated levels (see generator.py)")
+    scaling.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 30, 40, 50], help="side of the square levels")
+    scaling.add_argument("--boxes", type=int, nargs="+", default=[2, 5, 10, 20])
+    scaling.add_argument("--wall-density", type=float, default=0.2)
+    scaling.add_argument("--episodes", type=int, default=20, help="training episodes per level")
+    scaling.add_argument("--states", type=int, default=200, help="random-walk states the heuristics are evaluated on")
+    scaling.add_argument("--engine", choices=["array", "compact", "accel"], default="compact")
+    scaling.add_argument("--seed", type=int, default=0)
+
+    rollouts = subparsers.add_parser("rollouts", help="random rollouts with the scalar vs the batched engine")
+    rollouts.add_argument("levels", nargs="*", default=BUNDLED_LEVELS)
+    rollouts.add_argument("--rollouts", type=int, default=1024)
+    rollouts.add_argument("--length", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.benchmark == "push-distance":
+        compare(args.levels, args.episodes, {
+            'walk': {'engine': args.engine},
+            'push': {'engine': args.engine, 'push_distance': True},
+        })
+    elif args.benchmark == "solvers":
+        compare_solvers(args.levels, args.episodes, args.engine)
+    elif args.benchmark == "states":
+        compare_states(args.levels, args.limit)
+    elif args.benchmark == "planning":
+        variants = {'q-learning': {'engine': args.engine}}
+        for k in args.planning_steps:
+            variants[f"sweep-{k}"] = {'engine': args.engine, 'planning_steps': k}
+        compare(args.levels, args.episodes, variants)
+    elif args.benchmark == "traces":
+        variants = {'q-learning': {'engine': args.engine}}
+        for decay in args.trace_decay:
+            variants[f"lambda-{decay}"] = {'engine': args.engine, 'trace_decay': decay}
+        compare(args.levels, args.episodes, variants)
+    elif args.benchmark == "engines":
+        compare_engines(args.levels, args.episodes, args.engines)
+    elif args.benchmark == "parallel":
+        compare_parallel(args.levels, args.episodes, args.engine, args.workers, args.sync_every, args.seeds)
+    elif args.benchmark == "transitions":
+        compare_transitions(args.levels, args.states, args.engines)
+    elif args.benchmark == "micro":
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        results, regressions = run_micro(args.levels, args.states, args.episodes, args.repeat, baseline, args.threshold)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'states': args.states,
+                           'episodes': args.episodes, 'results': results}, f, indent=2)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    elif args.benchmark == "scaling":
+        run_scaling(args.sizes, args.boxes, args.wall_density, args.episodes, args.states, args.engine, args.seed)
+    elif args.benchmark == "rollouts":
+        compare_rollouts(args.levels, args.rollouts, args.length)
@@ -0,0 +1,360 @@
+import numpy as np
+from collections import deque
+from environment import INFEASIBLE, SPACE, ACTOR, WALL, BOX, TARGET, BOX_ON_TARGET, ACTOR_ON_TARGET, \
+    BASIC_REWARD, State, actions, zobrist_hash, canonical_key
+
+# Compact state engine: walls and targets live once in the shared environment.Level,
+# a state is only the actor cell plus the set of box cells. Every function mirrors
+# the one with the same name in environment.py and produces the same results.
+
+BLOCKED = (WALL, INFEASIBLE)
+OCCUPIED = (WALL, INFEASIBLE, BOX, BOX_ON_TARGET)
+
+class CompactState:
+    __slots__ = ('level', 'actor', 'boxes', 'key', 'canonical')
+
+    def __init__(self, level, actor, boxes, key=None):
+        self.level = level
+        self.actor = actor
+        self.boxes = boxes
+        self.key = zobrist_hash(self) if key is None else key
+        self.canonical = None # memoized canonical_key
+
+    def __copy__(self):
+        return self
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __hash__(self):
+        return self.key
+
+    @property
+    def actor_cell(self):
+        return self.actor
+
+    @property
+    def box_cells(self):
+        return tuple(self.boxes)
+
+def from_state(state):
+    return CompactState(state.level, state.actor_cell, frozenset(state.box_cells))
+
+def to_state(state):
+    level = state.level
+    np_map = np.array(level.grid[level.width:-level.width], dtype=float).reshape(level.rows, level.width)[:, 1:-1]
+    np_actor = np.array(level.loc(state.actor))
+    np_boxes = np.array([level.loc(b) for b in sorted(state.boxes)]).reshape(-1, 2)
+    np_targets = np.array([level.loc(t) for t in level.target_cells]).reshape(-1, 2)
+    for b in np_boxes:
+        np_map[b[0], b[1]] = BOX_ON_TARGET if np_map[b[0], b[1]] == TARGET else BOX
+    np_map[np_actor[0], np_actor[1]] = ACTOR_ON_TARGET if np_map[np_actor[0], np_actor[1]] == TARGET else ACTOR
+    return State(np_map, np_actor, np_boxes, np_targets, level)
+
+def get_location_status(state, cell):
+    status = state.level.static[cell]
+    if cell in state.boxes:
+        return BOX_ON_TARGET if status == TARGET else BOX
+    if cell == state.actor:
+        return ACTOR_ON_TARGET if status == TARGET else ACTOR
+    return status
+
+def step(state, action):
+    level = state.level
+    next_position = state.actor + level.moves[action]
+    boxes = state.boxes
+    key = state.key ^ level.actor_keys[state.actor] ^ level.actor_keys[next_position]
+    if next_position in boxes:
+        next_two_position = next_position + level.moves[action]
+        boxes = boxes.difference((next_position,)).union((next_two_position,))
+        key ^= level.box_keys[next_position] ^ level.box_keys[next_two_position]
+    return CompactState(level, next_position, boxes, key)
+
+def get_feasible_actions(state):
+    return [action for action in actions if is_feasible_action(state, action)]
+
+# flood fill of the cells the actor can walk to without pushing a box
+def walk(state):
+    """
+    :return: BFS tree mapping every reachable cell to (previous cell, action), the actor cell to None
+    """
+    level, boxes = state.level, state.boxes
+    tree = {state.actor: None}
+    q = deque([state.actor])
+    while q:
+        cell = q.popleft()
+        for action, d in level.moves.items():
+            n = cell + d
+            if n not in tree and level.is_floor(n) and n not in boxes:
+                tree[n] = (cell, action)
+                q.append(n)
+    return tree
+
+def walk_path(tree, cell):
+    """
+    :return: shortest list of actions from the root of tree to cell
+    """
+    path = []
+    while tree[cell] is not None:
+        cell, action = tree[cell]
+        path.append(action)
+    path.reverse()
+    return path
+
+def get_pushes(state, tree=None):
+    """
+    :param tree: result of walk(state), computed if not given
+    :return: list of (box, action) pushes the actor can reach and make without moving other boxes
+    """
+    level, boxes = state.level, state.boxes
+    tree = walk(state) if tree is None else tree
+    pushes = []
+    for box in sorted(boxes):
+        for action, d in level.moves.items():
+            if box - d in tree and level.is_floor(box + d) and box + d not in boxes:
+                pushes.append((box, action))
+    return pushes
+
+def expand_pushes(state, pushes):
+    """
+    :param pushes: list of (box, action) pushes, each reachable after the previous ones
+    :return: the primitive actions that walk to and carry out every push from state
+    """
+    solution = []
+    for box, action in pushes:
+        solution += walk_path(walk(state), box - state.level.moves[action]) + [action]
+        state = push(state, box, action)
+    return solution
+
+def push(state, box, action):
+    """
+    :return: state after the actor walked next to box and pushed it once in direction action
+    """
+    level = state.level
+    dest = box + level.moves[action]
+    key = state.key ^ level.actor_keys[state.actor] ^ level.actor_keys[box] ^ level.box_keys[box] ^ level.box_keys[dest]
+    return CompactState(level, box, state.boxes.difference((box,)).union((dest,)), key)
+
+def get_pulls(state, tree=None):
+    """
+    Reverse moves of get_pushes, for searching backwards from a goal layout.
+    :param tree: result of walk(state), computed if not given
+    :return: list of (box, action) such that state results from pushing box in direction action
+        from a state where the actor stands in the region of box - 2 * moves[action]
+    """
+    level, boxes = state.level, state.boxes
+    tree = walk(state) if tree is None else tree
+    pulls = []
+    for box in sorted(boxes):
+        for action, d in level.moves.items():
+            # the actor stands where the box comes from and steps back into box - 2d
+            if box - d in tree and level.is_floor(box - 2 * d) and box - 2 * d not in boxes:
+                pulls.append((box, action))
+    return pulls
+
+def pull(state, box, action):
+    """
+    :return: state before the push of box - moves[action] in direction action that gave state
+        (the actor stands behind the box, where the push started)
+    """
+    level = state.level
+    d = level.moves[action]
+    src, back = box - d, box - 2 * d
+    key = state.key ^ level.actor_keys[state.actor] ^ level.actor_keys[back] ^ level.box_keys[box] ^ level.box_keys[src]
+    return CompactState(level, back, state.boxes.difference((box,)).union((src,)), key)
+
+def is_feasible_action(state, action):
+    d = state.level.moves[action]
+    next_position = state.actor + d
+    status = get_location_status(state, next_position)
+    if status in (SPACE, TARGET):
+        return True
+    if status in (BOX, BOX_ON_TARGET):
+        return get_location_status(state, next_position + d) not in OCCUPIED
+    return False
+
+def count_walls(state, cell):
+    count = 0
+    for d in state.level.moves.values():
+        if get_location_status(state, cell + d) == WALL:
+            count += 1
+    return count
+
+def get_reward(state, action, new_state):
+    reward = get_move_reward(state, action, new_state)
+
+    if is_goal(new_state):
+        reward += BASIC_REWARD['GOAL']
+    elif is_deadlock(new_state, action):
+        reward += BASIC_REWARD['DEADLOCK']
+
+    return reward
+
+# reward of the move itself, without the goal/deadlock terms of the resulting state
+def get_move_reward(state, action, new_state):
+    if not is_feasible_action(state, action):
+        return BASIC_REWARD['INFEASIBLE']
+    d = state.level.moves[action]
+    next_position = state.actor + d
+    next_pos_status = get_location_status(state, next_position)
+    if next_pos_status in (SPACE, TARGET):
+        return BASIC_REWARD['SPACE']
+    return get_push_reward(state, next_position, d, next_pos_status)
+
+# reward of a feasible push of the box at box_position in direction d
+def get_push_reward(state, box_position, d, box_status):
+    reward = 0
+    box_next_position = box_position + d
+    if not state.level.in_bounds(box_next_position):
+        return reward + BASIC_REWARD['INFEASIBLE']
+    box_next_pos_status = get_location_status(state, box_next_position)
+    # push box off target
+    if box_status == BOX_ON_TARGET:
+        if box_next_pos_status == SPACE:
+            reward += BASIC_REWARD['OFF_TARGET']
+        elif box_next_pos_status == TARGET:
+            reward += BASIC_REWARD['ON_TARGET'] ** 2
+            wall_count = count_walls(state, box_next_position)
+            if wall_count >= 2:
+                reward *= (wall_count - 1) * 1000
+            box_next_position += d
+            while state.level.in_bounds(box_next_position):
+                if get_location_status(state, box_next_position) == TARGET:
+                    reward *= 5
+                else:
+                    break
+                box_next_position += d
+    elif box_status == BOX:
+        if box_next_pos_status in (WALL, BOX, BOX_ON_TARGET):
+            reward += BASIC_REWARD['INFEASIBLE']
+        elif box_next_pos_status == TARGET:
+            reward += BASIC_REWARD['ON_TARGET']
+            box_next_position += d
+            while state.level.in_bounds(box_next_position):
+                if get_location_status(state, box_next_position) == TARGET:
+                    reward += BASIC_REWARD['ON_TARGET']
+                else:
+                    break
+                box_next_position += d
+        elif box_next_pos_status == SPACE:
+            reward += BASIC_REWARD['ON_SPACE']
+            loc = box_next_position + d
+            if state.level.in_bounds(loc):
+                loc_status = get_location_status(state, loc)
+                if loc_status == BOX:
+                    reward += BASIC_REWARD['BOX_BY_BOX']
+                elif loc_status == WALL:
+                    reward += BASIC_REWARD['BOX_BY_WALL']
+            else:
+                reward += BASIC_REWARD['BOX_BY_WALL']
+    return reward
+
+def get_transitions(state):
+    """
+    Every feasible action of state with its outcome, computed together: the cells around the actor
+    are read once per direction, and walks, which leave the boxes where they are, share one goal and
+    frozen-box check of the current layout instead of repeating it for each successor.
+    :return: list of (action, successor, reward, goal, deadlock) in environment.actions order, with
+        rewards as get_reward and deadlock only set when the successor is not a goal
+    """
+    level, boxes = state.level, state.boxes
+    actor_keys = level.actor_keys
+    layout = None # (goal, frozen) of the current box layout, computed on the first walk
+    result = []
+    for action, d in level.moves.items():
+        next_position = state.actor + d
+        status = get_location_status(state, next_position)
+        if status in (SPACE, TARGET):
+            key = state.key ^ actor_keys[state.actor] ^ actor_keys[next_position]
+            new_state = CompactState(level, next_position, boxes, key)
+            reward = BASIC_REWARD['SPACE']
+            if layout is None:
+                layout = is_goal(state), is_frozen(state)
+            goal = layout[0]
+            deadlock = not goal and (layout[1] or is_wall_deadlock(new_state, action))
+        elif status in (BOX, BOX_ON_TARGET) and get_location_status(state, next_position + d) not in OCCUPIED:
+            new_state = step(state, action)
+            reward = get_push_reward(state, next_position, d, status)
+            goal = is_goal(new_state)
+            deadlock = not goal and is_deadlock(new_state, action)
+        else:
+            continue
+        if goal:
+            reward += BASIC_REWARD['GOAL']
+        elif deadlock:
+            reward += BASIC_REWARD['DEADLOCK']
+        result.append((action, new_state, reward, goal, deadlock))
+    return result
+
+def is_goal(state):
+    return state.boxes <= state.level.targets
+
+# state: current state
+# action: action used to get to current state
+def is_deadlock(state, action):
+    return is_frozen(state) or is_wall_deadlock(state, action)
+
+# true if a box off target can never move again
+def is_frozen(state):
+    level = state.level
+    moves = level.moves
+    for loc in state.boxes:
+        if loc in level.targets:
+            continue
+        # static dead squares cover boxes stuck in corners or against target-free walls
+        if level.dead[loc]:
+            return True
+        # frozen against a neighboring box
+        if any(loc + d in state.boxes for d in moves.values()) and is_immovable(state, loc):
+            return True
+    return False
+
+# true if action pushed a box against a wall along which fewer targets than boxes are left
+def is_wall_deadlock(state, action):
+    moves = state.level.moves
+    loc = state.actor + moves[action]
+    if get_location_status(state, loc) == BOX and get_location_status(state, loc + moves[action]) in BLOCKED:
+        for dir, perp in [(['UP', 'DOWN'], ['LEFT', 'RIGHT']), (['LEFT', 'RIGHT'], ['UP', 'DOWN'])]:
+            if action in dir:
+                cts = True
+                target_count = 0
+                box_count = 0
+
+                for a in perp:
+                    l = loc + moves[a]
+                    status = get_location_status(state, l)
+                    while status not in BLOCKED:
+                        if status == TARGET:
+                            target_count += 1
+                        elif status == BOX:
+                            box_count += 1
+                        if get_location_status(state, l + moves[dir[0]]) not in BLOCKED and \
+                            get_location_status(state, l + moves[dir[1]]) not in BLOCKED:
+                            cts = False
+                        l += moves[a]
+                        status = get_location_status(state, l)
+                if cts and box_count + 1 > target_count:
+                    return True
+    return False
+
+# returns true if a box at loc is immovable
+def is_immovable(state, loc):
+    moves = state.level.moves
+    for a1, a2 in [('UP', 'RIGHT'), ('RIGHT', 'DOWN'), ('DOWN', 'LEFT'), ('LEFT', 'UP')]:
+        n1 = loc + moves[a1]
+        n2 = loc + moves[a2]
+        n1_status = get_location_status(state, n1)
+        n2_status = get_location_status(state, n2)
+
+        if n1_status in OCCUPIED and n2_status in OCCUPIED:
+            if n1_status in BLOCKED and n2_status in BLOCKED:
+                return True
+            for n, status, a in [(n1, n1_status, a1), (n2, n2_status, a2)]:
+                if status in (BOX, BOX_ON_TARGET):
+                    # detect 2 box placement
+                    perp = ('LEFT', 'RIGHT') if a in ('UP', 'DOWN') else ('UP', 'DOWN')
+                    loc_blocked = any(get_location_status(state, loc + moves[x]) in OCCUPIED for x in perp)
+                    n_blocked = any(get_location_status(state, n + moves[x]) in OCCUPIED for x in perp)
+                    if loc_blocked and n_blocked:
+                        return True
+    return False
@@ -0,0 +1,13 @@
+import environment
+import glob
+import os
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEVELS = sorted(os.path.basename(path) for path in glob.glob(os.path.join(HERE, "sokoban-*.txt")))
+
+@pytest.fixture(params=LEVELS)
+def init_state(request):
+    """Initial state of every bundled level, or of the level files given by indirect parametrization."""
+    with open(os.path.join(HERE, request.param), 'r') as f:
+        return environment.State.from_config(f.read())
@@ -1,4 +1,6 @@
+import hashlib
 import numpy as np
+from collections import deque
 from copy import copy
 from dataclasses import dataclass
 
@@ -16,18 +18,23 @@ DOWN = np.array([1, 0])
 LEFT = np.array([0, -1])
 RIGHT = np.array([0, 1])
 actions = {'UP': UP, 'LEFT': LEFT, 'DOWN': DOWN, 'RIGHT': RIGHT}
+action_index = {a: i for i, a in enumerate(actions)} # column of each action in a QTable
+
+ZOBRIST_SEED = 271
 
 BASIC_REWARD = {'SPACE': -10, 'BOX_BY_BOX': -3, 'BOX_BY_WALL': -5, 'INFEASIBLE': -199, \
                 'ON_TARGET': 100, 'ON_SPACE': 0, 'OFF_TARGET': -100, 'DEADLOCK': -10e10, 'GOAL': 10e10}
 
 class State:
-    def __init__(self, map_array, actor, boxes, targets):
+    def __init__(self, map_array, actor, boxes, targets, level=None, key=None):
         self.map = np.copy(map_array)
         self.actor = np.copy(actor)
         self.boxes = np.copy(boxes)
         self.targets = np.copy(targets)
-        self.key = state_hash(self)
         self.test = False
+        self._level = level
+        self.key = zobrist_hash(self) if key is None else key
+        self.canonical = None # memoized canonical_key
 
     @classmethod
     def from_config(cls, config_text):
@@ -70,35 +77,170 @@ class State:
         return cls(np_map, np_actor, np_boxes, np_targets)
 
     def __copy__(self):
-        return State(np.copy(self.map), np.copy(self.actor), np.copy(self.boxes), np.copy(self.targets))
+        return State(np.copy(self.map), np.copy(self.actor), np.copy(self.boxes), np.copy(self.targets), self._level, self.key)
+
+    @property
+    def level(self):
+        # static layout is shared by every state derived from this one
+        if self._level is None:
+            self._level = Level.from_state(self)
+        return self._level
+
+    @property
+    def actor_cell(self):
+        return self.level.cell(self.actor[0], self.actor[1])
+
+    @property
+    def box_cells(self):
+        return tuple(self.level.cell(b[0], b[1]) for b in self.boxes)
 
     def __eq__(self, other) :
         return self.key == other.key
 
     def __hash__(self):
-        return hash(self.key)
+        return self.key
+
+class Level:
+    """
+    Static part of a level (walls and targets), computed once and shared by all states.
+    Cells are indices into a flat grid padded with one INFEASIBLE cell on every side,
+    so a single move from any in-bounds cell never leaves the grid.
+    """
+    def __init__(self, rows, cols, walls, targets):
+        self.rows = rows
+        self.cols = cols
+        self.width = cols + 2
+        self.size = (rows + 2) * self.width
+
+        grid = np.full((rows + 2, cols + 2), INFEASIBLE, dtype=np.int8)
+        grid[1:-1, 1:-1] = SPACE
+        for r, c in walls:
+            grid[r + 1, c + 1] = WALL
+        for r, c in targets:
+            grid[r + 1, c + 1] = TARGET
+        self.grid = grid.ravel()
+        self.static = tuple(int(x) for x in self.grid)
+
+        self.target_cells = tuple(self.cell(r, c) for r, c in targets)
+        self.targets = frozenset(self.target_cells)
+        self.moves = {'UP': -self.width, 'LEFT': -1, 'DOWN': self.width, 'RIGHT': 1}
+
+        # random 64-bit Zobrist keys per (cell, piece); the seed is fixed so keys are stable across runs
+        rng = np.random.default_rng(ZOBRIST_SEED)
+        keys = rng.integers(0, 2 ** 63, size=(2, self.size), dtype=np.int64)
+        self.actor_keys = keys[0].tolist()
+        self.box_keys = keys[1].tolist()
+
+        # simple dead squares: floor cells from which no box can ever be pushed onto a target
+        live = self.pull_distances(self.target_cells) < np.inf
+        self.dead = tuple(bool(s in (SPACE, TARGET) and not l) for s, l in zip(self.static, live))
 
-# hash based on location of agent only
-def loc_hash(state):
-    r, c = state.map.shape
-    b = max(r, c)
-    return state.actor[0] * b + state.actor[1]
-
-# return hash based on location of agent and boxes
-def state_hash(state):
-    sorted_boxes = np.array([]).reshape(0, 2)
-    if len(state.boxes) > 0:
-        sorted_boxes = state.boxes[np.lexsort((state.boxes[:, 1], state.boxes[:, 0]))]
-    r, c = state.map.shape
-    base = max(r, c)
-    value = state.actor[0] + state.actor[1] * base
-    for i, b in enumerate(sorted_boxes):
-        j = 2 * (i + 1)
-        value += b[0] * base ** j + b[1] * base ** (j + 1)
-    return hash(value)
+    @classmethod
+    def from_state(cls, state):
+        r, c = state.map.shape
+        walls = np.argwhere(state.map == WALL)
+        return cls(r, c, [(int(w[0]), int(w[1])) for w in walls], [(int(t[0]), int(t[1])) for t in state.targets])
+
+    def fingerprint(self):
+        """:return: hex digest identifying the layout (dimensions, walls and targets)"""
+        digest = hashlib.sha256(f"{self.rows}x{self.cols}:".encode())
+        digest.update(np.ascontiguousarray(self.grid, dtype=np.int8).tobytes())
+        return digest.hexdigest()[:32]
+
+    def cell(self, r, c):
+        return (int(r) + 1) * self.width + int(c) + 1
+
+    def loc(self, cell):
+        return cell // self.width - 1, cell % self.width - 1
+
+    def in_bounds(self, cell):
+        return self.static[cell] != INFEASIBLE
+
+    def is_floor(self, cell):
+        return self.static[cell] in (SPACE, TARGET)
+
+    def pull_distances(self, sources):
+        """
+        Reverse-pull BFS ignoring other boxes.
+        :param sources: cells the box has to end up on
+        :return: array with the minimum number of pushes needed to bring a box from each cell
+                 onto one of sources (np.inf if impossible)
+        """
+        dist = np.full(self.size, np.inf)
+        q = deque()
+        for s in sources:
+            dist[s] = 0
+            q.append(s)
+        while q:
+            cell = q.popleft()
+            for d in self.moves.values():
+                # the box came from cell - d, pushed by the actor standing at cell - 2d
+                prev = cell - d
+                if dist[prev] == np.inf and self.is_floor(prev) and self.is_floor(prev - d):
+                    dist[prev] = dist[cell] + 1
+                    q.append(prev)
+        return dist
+
+    def push_distances(self, sources):
+        """
+        Forward push BFS ignoring other boxes, the mirror image of pull_distances.
+        :param sources: cells the box starts on
+        :return: array with the minimum number of pushes needed to bring a box from one of sources
+                 onto each cell (np.inf if impossible)
+        """
+        dist = np.full(self.size, np.inf)
+        q = deque()
+        for s in sources:
+            dist[s] = 0
+            q.append(s)
+        while q:
+            cell = q.popleft()
+            for d in self.moves.values():
+                # the actor stands at cell - d and pushes the box to cell + d
+                nxt = cell + d
+                if dist[nxt] == np.inf and self.is_floor(nxt) and self.is_floor(cell - d):
+                    dist[nxt] = dist[cell] + 1
+                    q.append(nxt)
+        return dist
+
+# return Zobrist hash of location of agent and boxes, computed from scratch
+# (step keeps it up to date incrementally)
+def zobrist_hash(state):
+    level = state.level
+    value = level.actor_keys[state.actor_cell]
+    for b in state.box_cells:
+        value ^= level.box_keys[b]
+    return value
+
+# cells the actor can walk to without pushing a box (flood fill)
+def reachable_cells(state):
+    level = state.level
+    boxes = set(state.box_cells)
+    start = state.actor_cell
+    region = {start}
+    stack = [start]
+    while stack:
+        cell = stack.pop()
+        for d in level.moves.values():
+            n = cell + d
+            if n not in region and level.is_floor(n) and n not in boxes:
+                region.add(n)
+                stack.append(n)
+    return region
+
+# return hash of the boxes plus the top-left-most cell of the actor's region: states that only
+# differ by where the actor stands inside one free region share it
+def canonical_key(state, region=None):
+    if state.canonical is None:
+        level = state.level
+        region = reachable_cells(state) if region is None else region
+        state.canonical = state.key ^ level.actor_keys[state.actor_cell] ^ level.actor_keys[min(region)]
+    return state.canonical
 
 def step(state, action):
     new_state = copy(state)
+    level = state.level
+    actor_keys, box_keys = level.actor_keys, level.box_keys
     next_position = state.actor + actions[action]
 
     # conditions when pushing:
@@ -133,13 +275,16 @@ def step(state, action):
             if np.array_equal(new_state.boxes[i], next_position):
                 new_state.boxes[i] = next_two_position
                 break
-        
+        new_state.key ^= box_keys[level.cell(next_position[0], next_position[1])] ^ \
+            box_keys[level.cell(next_two_position[0], next_two_position[1])]
+
     elif state.map[next_position[0]][next_position[1]] == TARGET:
         new_state.map[next_position[0]][next_position[1]] = ACTOR_ON_TARGET
 
     # update actor position in the new state
     new_state.actor = next_position
-    new_state.key = state_hash(new_state)
+    new_state.key ^= actor_keys[level.cell(state.actor[0], state.actor[1])] ^ \
+        actor_keys[level.cell(next_position[0], next_position[1])]
 
     return new_state
 
@@ -160,6 +305,35 @@ def count_walls(state, position):
     return count
 
 def get_reward(state, action, new_state):
+    reward = get_move_reward(state, action, new_state)
+
+    if is_goal(new_state):
+        reward += BASIC_REWARD['GOAL']
+    elif is_deadlock(new_state, action):
+        reward += BASIC_REWARD['DEADLOCK']
+
+    return reward
+
+def get_transitions(state):
+    """
+    :return: list of (action, successor, reward, goal, deadlock) for every feasible action of state,
+        as compact.get_transitions
+    """
+    result = []
+    for action in get_feasible_actions(state):
+        new_state = step(state, action)
+        goal = is_goal(new_state)
+        deadlock = not goal and is_deadlock(new_state, action)
+        reward = get_move_reward(state, action, new_state)
+        if goal:
+            reward += BASIC_REWARD['GOAL']
+        elif deadlock:
+            reward += BASIC_REWARD['DEADLOCK']
+        result.append((action, new_state, reward, goal, deadlock))
+    return result
+
+# reward of the move itself, without the goal/deadlock terms of the resulting state
+def get_move_reward(state, action, new_state):
     reward = 0
 
     if is_feasible_action(state, action):
@@ -225,11 +399,6 @@ def get_reward(state, action, new_state):
     else:
         reward += BASIC_REWARD['INFEASIBLE']
 
-    if is_goal(new_state):
-        reward += BASIC_REWARD['GOAL']
-    elif is_deadlock(new_state, action):
-        reward += BASIC_REWARD['DEADLOCK']
-
     return reward
 
 def get_location_status(state, loc):
@@ -260,8 +429,16 @@ def is_goal(state):
 # state: current state
 # action: action used to get to current state 
 def is_deadlock(state, action):
+    level = state.level
     for loc in state.boxes:
-        if is_immovable(state, loc) and get_location_status(state, loc) != BOX_ON_TARGET:
+        if get_location_status(state, loc) == BOX_ON_TARGET:
+            continue
+        # static dead squares cover boxes stuck in corners or against target-free walls
+        if level.dead[level.cell(loc[0], loc[1])]:
+            return True
+        # frozen against a neighboring box
+        if any(get_location_status(state, loc + actions[a]) in [BOX, BOX_ON_TARGET] for a in actions) and \
+            is_immovable(state, loc):
             return True
 
     loc = state.actor + actions[action]
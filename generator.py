@@ -0,0 +1,123 @@
+import argparse
+import compact
+import random
+import sys
+from collections import deque
+from environment import Level
+
+# Level generator: lays out random walls, puts every box on a target and pulls boxes away from
+# their targets with compact.get_pulls/pull. Each pull undoes a push the actor can make, so the
+# pulls read backwards are a solution and every generated level is solvable.
+
+MAX_SIZE = 50
+MAX_BOXES = 20
+
+def _largest_region(floor):
+    # 4-connected component of floor cells with the most cells
+    best = set()
+    seen = set()
+    for start in sorted(floor):
+        if start in seen:
+            continue
+        region = {start}
+        q = deque([start])
+        while q:
+            r, c = q.popleft()
+            for n in ((r - 1, c), (r, c - 1), (r + 1, c), (r, c + 1)):
+                if n in floor and n not in region:
+                    region.add(n)
+                    q.append(n)
+        seen |= region
+        if len(region) > len(best):
+            best = region
+    return best
+
+def generate_level(rows, cols, boxes, wall_density=0.2, seed=0, pulls=None, attempts=100):
+    """
+    Generates a solvable level, the same one for the same arguments.
+    :param rows: rows of the level including its border walls, 5 to MAX_SIZE
+    :param cols: columns of the level including its border walls, 5 to MAX_SIZE
+    :param boxes: number of boxes (and targets), 1 to MAX_BOXES
+    :param wall_density: probability of each inner cell being a wall; floor cells cut off from the
+        largest floor region become walls too
+    :param pulls: reverse pulls made from the goal layout, 10 per box and 2 per row and column by default
+    :param attempts: layouts tried before giving up on one with enough room for the boxes
+    :return: config text in the 5-line format of State.from_config
+    """
+    if not (5 <= rows <= MAX_SIZE and 5 <= cols <= MAX_SIZE):
+        raise ValueError(f"level size must be between 5x5 and {MAX_SIZE}x{MAX_SIZE}, got {rows}x{cols}")
+    if not 1 <= boxes <= MAX_BOXES:
+        raise ValueError(f"number of boxes must be between 1 and {MAX_BOXES}, got {boxes}")
+    if not 0 <= wall_density < 1:
+        raise ValueError(f"wall density must be in [0, 1), got {wall_density}")
+    pulls = 10 * boxes + 2 * (rows + cols) if pulls is None else pulls
+    rng = random.Random(seed)
+
+    for _ in range(attempts):
+        inner = [(r, c) for r in range(1, rows - 1) for c in range(1, cols - 1)]
+        floor = _largest_region({cell for cell in inner if rng.random() >= wall_density})
+        if len(floor) < 2 * boxes + 1:
+            continue
+        walls = [(r, c) for r in range(rows) for c in range(cols) if (r, c) not in floor]
+        cells = sorted(floor)
+        targets = rng.sample(cells, boxes)
+        level = Level(rows, cols, walls, targets)
+        actor = rng.choice([cell for cell in cells if cell not in targets])
+        state = compact.CompactState(level, level.cell(*actor), frozenset(level.target_cells))
+
+        back = None # cell the last pulled box came from
+        for _ in range(pulls):
+            options = compact.get_pulls(state)
+            if not options:
+                break
+            # uniform pulls mostly shuffle a few boxes back and forth next to their targets: prefer
+            # pulls that neither put a box back on a target nor undo the previous pull, and among
+            # those the ones of boxes still on their targets
+            away = [(box, action) for box, action in options
+                    if box - level.moves[action] not in level.targets and box - level.moves[action] != back]
+            placed = [(box, action) for box, action in away if box in level.targets]
+            box, action = rng.choice(placed or away or options)
+            back = box
+            state = compact.pull(state, box, action)
+        if compact.is_goal(state):
+            continue
+        # the actor may start anywhere it can walk to from where the last pull left it, except on a
+        # target: State.from_config draws the actor over the target, which the array engine then loses
+        start = [cell for cell in sorted(compact.walk(state)) if cell not in level.targets]
+        if not start:
+            continue
+        actor = level.loc(rng.choice(start))
+        return to_config(rows, cols, walls, [level.loc(b) for b in sorted(state.boxes)], targets, actor)
+    raise ValueError(f"no {rows}x{cols} layout with wall density {wall_density} fits {boxes} boxes")
+
+def to_config(rows, cols, walls, boxes, targets, actor):
+    """
+    :param walls, boxes, targets: lists of 0-based (row, column) pairs
+    :param actor: 0-based (row, column) of the actor
+    :return: config text with 1-based coordinates, as read by State.from_config
+    """
+    def cells(locs):
+        return " ".join([str(len(locs))] + [f"{r + 1} {c + 1}" for r, c in locs])
+    return "\n".join([f"{rows} {cols}", cells(walls), cells(boxes), cells(targets), f"{actor[0] + 1} {actor[1] + 1}"])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates solvable levels in the input file format; "
+                                                 "several levels are separated by blank lines (see stream.py)")
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--boxes", type=int, default=5)
+    parser.add_argument("--wall-density", type=float, default=0.2)
+    parser.add_argument("--pulls", type=int, help="reverse pulls from the goal layout (default: scales with the level)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first level; level i uses seed + i")
+    parser.add_argument("--count", type=int, default=1, help="number of levels")
+    parser.add_argument("--output", help="file to write to instead of stdout")
+    args = parser.parse_args()
+
+    configs = [generate_level(args.rows, args.cols, args.boxes, args.wall_density, args.seed + i, args.pulls)
+               for i in range(args.count)]
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        output.write("\n\n".join(configs) + "\n")
+    finally:
+        if args.output:
+            output.close()
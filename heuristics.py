@@ -1,101 +1,182 @@
-import environment
 import numpy as np
-from copy import copy
+from cache import LRUCache
+from collections import namedtuple
 from scipy.optimize import linear_sum_assignment
-from queue import Queue
-
-class Node:
-    def __init__(self, state, prev, cost):
-        self.state = state
-        self.prev = prev
-        self.cost = cost
-
-# returns state with boxes/targets removed, actor moved to loc
-def get_clean_state(state, loc):
-    s = copy(state)
-    r, c = s.map.shape
-    boxes = s.boxes
-    targets = s.targets
-    map = s.map
-    actor = s.actor
-
-    # delete boxes and targets
-    for l in boxes:
-        map[l[0]][l[1]] = environment.SPACE
-    for l in targets:
-        map[l[0]][l[1]] = environment.SPACE
-    boxes = np.array([]).reshape(0, 0)
-    targets = np.array([]).reshape(0, 0)
-                
-    # move actor to set location
-    map[actor[0], actor[1]] = environment.SPACE
-    map[loc[0], loc[1]] = environment.ACTOR
-    
-    return environment.State(map, loc, boxes, targets)
 
 def get_distance_table(state):
-    table = {}
-    r, c = state.map.shape
-
-    for i in range(r):
-        for j in range(c):
-            if int(state.map[i, j]) != environment.WALL:
-                new_state = get_clean_state(state, np.array([i, j]))
-                
-                # compute distance matrix for location
-                compute_distance_matrix(table, new_state)
+    """
+    Computes walking distances between every pair of cells, ignoring boxes and targets.
+    Runs the BFS from all sources at once by shifting a boolean frontier over the flat grid.
+    :param state: any state of the level
+    :return: dense (cells x cells) array indexed by level cells; table[a, b] is 1 + the number of
+             steps between a and b, or -1 if b can't be reached from a (or a is not a floor cell)
+    """
+    level = state.level
+    walkable = np.array([level.is_floor(cell) for cell in range(level.size)])
+    sources = np.flatnonzero(walkable)
+
+    distances = np.full((len(sources), level.size), -1, dtype=np.int32)
+    reached = np.zeros((len(sources), level.size), dtype=bool)
+    reached[np.arange(len(sources)), sources] = True
+    frontier = reached.copy()
+    cost = 1
+    while frontier.any():
+        distances[frontier] = cost
+        # padding cells are never walkable, so wrapped-around values are always discarded
+        expanded = np.zeros_like(frontier)
+        for d in level.moves.values():
+            expanded |= np.roll(frontier, d, axis=1)
+        frontier = expanded & walkable & ~reached
+        reached |= frontier
+        cost += 1
+
+    table = np.full((level.size, level.size), -1, dtype=np.int32)
+    table[sources] = distances
     return table
 
-def compute_distance_matrix(table, state):
-    r, c = state.map.shape
-    distance_matrix = np.full((r, c), -1)
-    explored = {}
-    q = Queue()
-    q.put(Node(state, None, 0))
-
-    loc_hash = environment.loc_hash(state)
-
-    # use bfs to find shortest distance for each pair of points
-    while not q.empty():
-        node = q.get()
-        hash_val = environment.loc_hash(node.state)
-        if hash_val not in explored:
-            explored[hash_val] = 1
-            loc = node.state.actor
-            actions = environment.get_feasible_actions(node.state)
-            for a in actions:
-                new_state = environment.step(node.state, a)
-                new_node = Node(new_state, node, node.cost + 1)
-                if environment.loc_hash(new_state) not in explored:
-                    q.put(new_node)
-            distance_matrix[loc[0], loc[1]] = node.cost + 1
-    
-    # save distance matrix
-    table[loc_hash] = distance_matrix
+def get_push_distance_table(state):
+    """
+    Computes, for every target, the minimum number of pushes needed to bring a box from each cell
+    onto it (reverse pulls that leave room for the actor, ignoring other boxes).
+    :param state: any state of the level
+    :return: (targets x cells) array in level.target_cells order, np.inf where the target can't be reached
+    """
+    level = state.level
+    return np.array([level.pull_distances([t]) for t in level.target_cells]).reshape(-1, level.size)
+
+UNREACHABLE = 1e9 # stands in for inf inside the Hungarian solver
+
+Matching = namedtuple('Matching', ['boxes', 'cost', 'u', 'v', 'p', 'value'])
+
+def hungarian(cost):
+    """
+    Minimum cost assignment of every row to a distinct column (Hungarian method with potentials).
+    :param cost: list of n rows of m >= n finite costs
+    :return: (u, v, p) with row potentials u[1..n], column potentials v[1..m] and p[j] the 1-based
+             row assigned to column j (0 if none); index 0 is used internally
+    """
+    n, m = len(cost), len(cost[0]) if cost else 0
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    for i in range(1, n + 1):
+        augment(cost, i, u, v, p)
+    return u, v, p
+
+def augment(cost, i, u, v, p):
+    """
+    Assigns the unassigned row i (1-based) along a shortest augmenting path, updating u, v, p in place.
+    Needs cost[i - 1][j - 1] - u[i] - v[j] >= 0 for every j.
+    """
+    m = len(v) - 1
+    minv = [np.inf] * (m + 1)
+    used = [False] * (m + 1)
+    way = [0] * (m + 1)
+    p[0] = i
+    j0 = 0
+    while True:
+        used[j0] = True
+        i0 = p[j0]
+        row = cost[i0 - 1]
+        delta = np.inf
+        j1 = 0
+        for j in range(1, m + 1):
+            if not used[j]:
+                cur = row[j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+        for j in range(m + 1):
+            if used[j]:
+                u[p[j]] += delta
+                v[j] -= delta
+            else:
+                minv[j] -= delta
+        j0 = j1
+        if p[j0] == 0:
+            break
+    while j0:
+        j1 = way[j0]
+        p[j0] = p[j1]
+        j0 = j1
 
 # used for EMM heuristic
 class MinMatcher:
-    def __init__(self, distance_table):
+    def __init__(self, distance_table, push_table=None, cache_size=2 ** 16, parents=8):
         self.distance_table = distance_table
+        self.push_table = push_table
+        # matchings keyed on the box configuration only, so actor-only moves are free
+        self.cache = LRUCache(cache_size)
+        self.parents = parents # recent matchings checked for a single moved box on a miss
+        self.incremental = 0
 
-    def get_min_matching_cost(self, state):
-        row, col = state.map.shape
-        base = max(row, col)
-        
+    def stats(self):
+        return {**self.cache.stats(), 'incremental': self.incremental}
+
+    def get_cost_matrix(self, state, boxes):
         # create dist_matrix for given state (maps min distance of boxes to targets)
-        dist_matrix = np.zeros((len(state.boxes), len(state.targets)))
-        for i, b in enumerate(state.boxes):
-            for j, t in enumerate(state.targets):
-                dist_matrix[i, j] = self.distance_table[t[0] * base + t[1]][b[0]][b[1]]
-        
+        if self.push_table is not None:
+            return self.push_table[:, boxes].T
+        return self.distance_table[np.ix_(state.level.target_cells, boxes)].T
+
+    def get_min_matching_cost(self, state):
+        if self.cache.maxsize == 0:
+            return self.solve(state)
+        key = state.key ^ state.level.actor_keys[state.actor_cell]
+        matching = self.cache.get(key)
+        if matching is None:
+            matching = self.match(state)
+            self.cache.put(key, matching)
+        return matching.value
+
+    def solve(self, state):
+        dist_matrix = self.get_cost_matrix(state, state.box_cells)
+        # a box that can't reach any target makes every matching impossible
+        if np.isinf(dist_matrix).all(axis=1).any():
+            return np.inf
+
         # compute minimum perfect matching
-        r, c = linear_sum_assignment(dist_matrix)
+        try:
+            r, c = linear_sum_assignment(dist_matrix)
+        except ValueError:
+            # no assignment avoids the infinite entries
+            return np.inf
 
         # compute the cost of the matching
-        cost = 0
-        for i, j in zip(r, c):
-            cost += dist_matrix[i, j]
-        return cost
+        return dist_matrix[r, c].sum()
+
+    def match(self, state):
+        boxes = state.box_cells
+        if len(boxes) != len(state.level.target_cells):
+            return Matching(None, None, None, None, None, self.solve(state))
+
+        # a push moves exactly one box: repair a recent matching instead of solving from scratch
+        box_set = set(boxes)
+        for parent in self.cache.recent(self.parents):
+            if parent.boxes is None:
+                continue
+            moved = [i for i, b in enumerate(parent.boxes) if b not in box_set]
+            if len(moved) == 1:
+                i = moved[0]
+                new_box = box_set.difference(parent.boxes).pop()
+                row = np.minimum(self.get_cost_matrix(state, [new_box])[0], UNREACHABLE).tolist()
+                cost = parent.cost[:i] + [row] + parent.cost[i + 1:]
+                u, v, p = parent.u[:], parent.v[:], parent.p[:]
+                p[p.index(i + 1, 1)] = 0
+                u[i + 1] = min(c - v[j + 1] for j, c in enumerate(row))
+                augment(cost, i + 1, u, v, p)
+                self.incremental += 1
+                return self.make_matching(parent.boxes[:i] + (new_box,) + parent.boxes[i + 1:], cost, u, v, p)
+
+        cost = np.minimum(self.get_cost_matrix(state, boxes), UNREACHABLE).tolist()
+        return self.make_matching(tuple(boxes), cost, *hungarian(cost))
+
+    def make_matching(self, boxes, cost, u, v, p):
+        value = sum(cost[i - 1][j - 1] for j, i in enumerate(p) if j and i)
+        return Matching(boxes, cost, u, v, p, np.inf if value >= UNREACHABLE else value)
 
 class Heuristic:
     def __init__(self, dist_table):
@@ -105,23 +186,28 @@ class Heuristic:
         pass
 
 class EMMHeuristic(Heuristic):
-    def __init__(self, dist_table):
+    def __init__(self, dist_table, push_table=None, infeasible_cost=None):
         super().__init__(dist_table)
-        self.min_matcher = MinMatcher(dist_table)
+        self.min_matcher = MinMatcher(dist_table, push_table)
+        # returned instead of inf so heuristic differences stay finite; defaults to every box being
+        # as far from its target as the level allows (a huge value stalls the learner next to deadlocks)
+        if infeasible_cost is None and push_table is not None:
+            finite = push_table[np.isfinite(push_table)]
+            infeasible_cost = len(push_table) * (finite.max() if len(finite) else 0)
+        self.infeasible_cost = infeasible_cost
 
     def heuristic(self, state):
-        return self.min_matcher.get_min_matching_cost(state)
+        cost = self.min_matcher.get_min_matching_cost(state)
+        return self.infeasible_cost if cost == np.inf else cost
 
 class AgentBoxHeuristic(Heuristic):
     def __init__(self, dist_table):
         super().__init__(dist_table)
 
     def heuristic(self, state):
-        m = 10e10
-        dist = self.dist_table[environment.loc_hash(state)]
-
-        for b in state.boxes:
-            if state.map[b[0], b[1]] != environment.BOX_ON_TARGET:
-                d = dist[b[0], b[1]] # min distance to box location from actor
-                m = min(m, d)
-        return 0 if m == 10e10 else m
\ No newline at end of file
+        targets = state.level.targets
+        boxes = [b for b in state.box_cells if b not in targets]
+        if not boxes:
+            return 0
+        # min distance to box location from actor
+        return self.dist_table[state.actor_cell, boxes].min()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import compact
+from compact import CompactState, from_state, is_goal
+from environment import BASIC_REWARD, actions
+
+# Macro-action engine: same functions as environment.py/compact.py, but an action is
+# "push box i in direction d", encoded as the integer 4 * i + d with boxes in sorted cell
+# order and d the position of the direction in environment.actions. The actor walks to
+# the push position through its flood-filled region; walks are expanded into primitive
+# moves only by expand().
+
+directions = list(actions)
+
+def n_actions(state):
+    return len(directions) * len(state.boxes)
+
+def decode(state, action):
+    """:return: (box cell, direction name) of action in state"""
+    return sorted(state.boxes)[action // len(directions)], directions[action % len(directions)]
+
+def get_feasible_actions(state):
+    order = {box: i for i, box in enumerate(sorted(state.boxes))}
+    return [len(directions) * order[box] + directions.index(d) for box, d in compact.get_pushes(state)]
+
+def step(state, action):
+    box, d = decode(state, action)
+    return compact.push(state, box, d)
+
+def get_reward(state, action, new_state):
+    reward = get_move_reward(state, action, new_state)
+
+    if is_goal(new_state):
+        reward += BASIC_REWARD['GOAL']
+    elif is_deadlock(new_state, action):
+        reward += BASIC_REWARD['DEADLOCK']
+
+    return reward
+
+def get_transitions(state):
+    """
+    :return: list of (action, successor, reward, goal, deadlock) for every feasible action of state,
+        as compact.get_transitions
+    """
+    result = []
+    for action in get_feasible_actions(state):
+        new_state = step(state, action)
+        goal = is_goal(new_state)
+        deadlock = not goal and is_deadlock(new_state, action)
+        reward = get_move_reward(state, action, new_state)
+        if goal:
+            reward += BASIC_REWARD['GOAL']
+        elif deadlock:
+            reward += BASIC_REWARD['DEADLOCK']
+        result.append((action, new_state, reward, goal, deadlock))
+    return result
+
+# sum of the primitive rewards of the macro action: one SPACE step per move of the walk
+# to the box, plus the push shaped exactly like the primitive push from next to the box
+def get_move_reward(state, action, new_state):
+    box, d = decode(state, action)
+    stand = box - state.level.moves[d]
+    walk_length = len(compact.walk_path(compact.walk(state), stand))
+    before = CompactState(state.level, stand, state.boxes)
+    return walk_length * BASIC_REWARD['SPACE'] + compact.get_move_reward(before, d, new_state)
+
+# state: current state
+# action: push used to get to current state
+def is_deadlock(state, action):
+    # after a push the actor stands where the box was, as after the primitive move
+    if compact.is_deadlock(state, directions[action % len(directions)]):
+        return True
+    return not is_goal(state) and not compact.get_pushes(state)
+
+def expand(state, macro_actions):
+    """
+    :return: the primitive actions that carry out macro_actions from state
+    """
+    pushes = []
+    current = state
+    for action in macro_actions:
+        pushes.append(decode(current, action))
+        current = step(current, action)
+    return compact.expand_pushes(state, pushes)
@@ -1,42 +1,183 @@
 import environment
+import heuristics
 import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from parallel import STORE_MEMORY, learn_parallel
+from profiling import Profiler
 from qlearning import QLearner
+from search import Solver
+from stream import run_stream
+from tablecache import TableCache
 from time import perf_counter
 import numpy as np
 
+# per-process cache of level tables, so every worker builds them once per level
+_levels = {}
+
 def print_data(name, data):
     print(f"{name}: mean={np.mean(data)}, min={np.min(data)}, max={np.max(data)}, std={np.std(data)}")
 
+def read_config(path):
+    with open(path, 'r') as f:
+        return "".join(f.readlines())
+
+def load_level(path, push_distance=False, cache_dir=None):
+    """
+    :param cache_dir: directory of a TableCache shared across processes and runs (None: build in memory)
+    :return: (initial state, distance table, push distance table or None) of the level in path, cached per process
+    """
+    cache = TableCache(cache_dir) if cache_dir else heuristics
+    if path not in _levels:
+        init_state = environment.State.from_config(read_config(path))
+        _levels[path] = (init_state, cache.get_distance_table(init_state), None)
+    init_state, distance_table, push_table = _levels[path]
+    if push_distance and push_table is None:
+        push_table = cache.get_push_distance_table(init_state)
+        _levels[path] = (init_state, distance_table, push_table)
+    return _levels[path]
+
+def run_experiment(path, seed, episodes, engine, push_distance, canonical=False, cache_dir=None):
+    """
+    Trains one seeded QLearner on the level in path.
+    :return: dict describing the run
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    init_state, distance_table, push_table = load_level(path, push_distance, cache_dir)
+
+    t0 = perf_counter()
+    qlearner = QLearner(init_state, engine=engine, push_distance=push_distance,
+                        distance_table=distance_table, push_table=push_table, canonical=canonical)
+    n, actions = qlearner.learn(episodes, display=False)
+    t1 = perf_counter()
+    steps = qlearner.t - 1
+    return {'level': path, 'seed': seed, 'episodes': qlearner.episodes, 'solved': n > 0,
+            'solution_length': n, 'time_ms': (t1 - t0) * 1000, 'steps': steps,
+            'steps_per_sec': steps / (t1 - t0) if t1 > t0 else 0.0}
+
+def run_benchmark(paths, seeds, episodes, engine, push_distance, workers, output, canonical=False, cache_dir=None):
+    """
+    Runs every (level, seed) pair across a process pool, streams each finished run to output as
+    one JSON line and prints aggregates per level once all runs are done.
+    """
+    results = {path: [] for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_experiment, path, seed, episodes, engine, push_distance, canonical, cache_dir)
+                   for seed in seeds for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['level']].append(result)
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+
+    for path in paths:
+        runs = results[path]
+        print(f"{path}: {sum(r['solved'] for r in runs)}/{len(runs)} solved")
+        print_data("Episode count", [r['episodes'] for r in runs])
+        print_data("Min episode length", [r['solution_length'] for r in runs])
+        print_data("Time", [r['time_ms'] for r in runs])
+        print_data("Steps/sec", [r['steps_per_sec'] for r in runs])
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser("Put your file here")
     parser.add_argument("command", nargs="*")
+    parser.add_argument("--solver", choices=["qlearning", "astar", "idastar", "bidirectional"], default="qlearning",
+                        help="Q-learning, A*/IDA* over push moves, or push/pull search from both ends "
+                             "(single runs only)")
+    parser.add_argument("--engine", choices=["array", "compact", "accel", "macro"], default="array",
+                        help="state representation used while learning")
+    parser.add_argument("--push-distance", action="store_true",
+                        help="match boxes to targets by push distance in the EMM heuristic")
+    parser.add_argument("--planning-steps", type=int, default=0,
+                        help="prioritized-sweeping backups over observed transitions after every real step")
+    parser.add_argument("--trace-decay", type=float, default=0.0,
+                        help="lambda of Watkins Q(lambda) with replacing traces (0: one-step Q-learning)")
+    parser.add_argument("--canonical", action="store_true",
+                        help="key states by box layout and actor region (macro engine and search solvers)")
+    parser.add_argument("--episodes", type=int, default=1000, help="maximum number of training episodes")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="train every seed on every input file in parallel and report statistics")
+    parser.add_argument("--stream", action="store_true",
+                        help="solve every level of the input files/directories (5 lines per level, any number per file) "
+                             "in parallel, writing one JSON line per level")
+    parser.add_argument("--time-limit", type=float, help="seconds allowed per level in stream mode")
+    parser.add_argument("--memory-limit", type=int, help="memory (MB) a level may use in stream mode, on top of what its worker process already maps")
+    parser.add_argument("--parallel", action="store_true",
+                        help="train --workers asynchronous learners sharing one Q-table until the first solves the level")
+    parser.add_argument("--sync-every", type=int, default=1,
+                        help="episodes between merges of a worker's Q-values into the shared table in parallel mode")
+    parser.add_argument("--store-memory", type=int, default=STORE_MEMORY,
+                        help="MB of shared memory for the shared Q-table in parallel mode; states that do not fit "
+                             "are learned by one worker only")
+    parser.add_argument("--seeds", type=int, default=10, help="number of seeds per level in benchmark mode")
+    parser.add_argument("--seed", type=int, default=0, help="first seed (benchmark) or the seed of a single run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes in benchmark/stream/parallel mode")
+    parser.add_argument("--output", help="JSONL file receiving one line per run in benchmark/stream mode (default: stdout)")
+    parser.add_argument("--checkpoint", help="resume from this Q-table checkpoint if it exists, and save to it while learning")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="episodes between checkpoints")
+    parser.add_argument("--cache-dir", help="directory caching per-level distance tables on disk across runs")
+    parser.add_argument("--profile", help="write a JSON summary of per-phase timers and counters to this file")
+    parser.add_argument("--profile-csv", help="write one CSV row per training episode to this file")
     args = parser.parse_args()
     if len(args.command):
-        with open(args.command[0], 'r') as f:
-            config_text = "".join(f.readlines())
-            episodes = 1000
-            init_state = environment.State.from_config(config_text)
-
-            testing = False
-
-            if testing:
-                ep_counts, sol_lens, times = [], [], []
-                for i in range(10):
-                    t0 = perf_counter()
-                    qlearner = QLearner(init_state)
-                    ep_count, sol_len = qlearner.learn(episodes, display=False)
-                    t1 = perf_counter()
-                    ep_counts.append(ep_count)
-                    sol_lens.append(sol_len)
-                    times.append((t1 - t0) * 1000)
-                    print(ep_count, sol_len, (t1-t0) * 1000)
-                print_data("Episode count", ep_counts)
-                print_data("Min episode length", sol_lens)
-                print_data("Time", times)
+        if args.stream:
+            output = open(args.output, 'w') if args.output else sys.stdout
+            try:
+                counts = run_stream(args.command, output, args.workers, solver=args.solver, episodes=args.episodes,
+                                    engine=args.engine, push_distance=args.push_distance, seed=args.seed,
+                                    time_limit=args.time_limit, memory_limit=args.memory_limit)
+            finally:
+                if args.output:
+                    output.close()
+            print(json.dumps(counts), file=sys.stderr)
+        elif args.benchmark:
+            seeds = range(args.seed, args.seed + args.seeds)
+            output = open(args.output, 'w') if args.output else sys.stdout
+            try:
+                run_benchmark(args.command, seeds, args.episodes, args.engine, args.push_distance, args.workers, output, args.canonical,
+                              args.cache_dir)
+            finally:
+                if args.output:
+                    output.close()
+        else:
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+            init_state = environment.State.from_config(read_config(args.command[0]))
+            # without a cache directory the learner/solver build (and profile) their own tables
+            distance_table = push_table = None
+            if args.cache_dir:
+                init_state, distance_table, push_table = load_level(
+                    args.command[0], args.push_distance or args.solver != "qlearning", args.cache_dir)
+            if args.solver != "qlearning":
+                solver = Solver(init_state, distance_table, push_table, canonical=args.canonical)
+                n, actions = getattr(solver, args.solver)()
+                print(f"{n} {' '.join(map(lambda x: x[0], actions))}")
+            elif args.parallel:
+                n, actions, _ = learn_parallel(init_state, args.workers, args.episodes, seed=args.seed,
+                                               sync_every=args.sync_every, store_memory=args.store_memory,
+                                               engine=args.engine, push_distance=args.push_distance,
+                                               distance_table=distance_table, push_table=push_table,
+                                               canonical=args.canonical,
+                                               planning_steps=args.planning_steps, trace_decay=args.trace_decay)
+                print(f"{n} {' '.join(map(lambda x: x[0], actions))}")
             else:
-                qlearner = QLearner(init_state)
-                n, actions = qlearner.learn(episodes, display=False)
+                profiler = Profiler() if args.profile or args.profile_csv else None
+                qlearner = QLearner(init_state, engine=args.engine, push_distance=args.push_distance, profiler=profiler,
+                                    distance_table=distance_table, push_table=push_table, canonical=args.canonical,
+                                    planning_steps=args.planning_steps, trace_decay=args.trace_decay)
+                if args.checkpoint and os.path.exists(args.checkpoint):
+                    qlearner.load(args.checkpoint)
+                n, actions = qlearner.learn(args.episodes, display=False, checkpoint=args.checkpoint,
+                                            checkpoint_every=args.checkpoint_every)
                 print(f"{n} {' '.join(map(lambda x: x[0], actions))}")
+                if args.profile:
+                    with open(args.profile, 'w') as f:
+                        json.dump(qlearner.profile_summary(), f, indent=2)
+                if args.profile_csv:
+                    profiler.write_csv(args.profile_csv)
     else:
         print("No input file specified")
-
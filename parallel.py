@@ -0,0 +1,232 @@
+import compact
+import environment
+import heuristics
+import macro
+import multiprocessing
+import random
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from qlearning import QLearner
+from qtable import QTable
+from time import perf_counter, process_time
+
+# Asynchronous parallel Q-learning: several worker processes train on the same level, each with its
+# own seed and exploration rate, and every few episodes publish their Q-value changes to one store in
+# shared memory. The first worker to reach the goal tells the others to stop.
+
+EMPTY = -1 # key of a free store slot; state keys are never negative
+STORE_MEMORY = 64 # MB of shared memory the store takes by default
+
+def store_capacity(n_actions, memory=STORE_MEMORY, dtype=np.float32):
+    """:return: largest power-of-two number of store slots whose key and Q-values fit in memory MB"""
+    slot = 8 + n_actions * np.dtype(dtype).itemsize
+    return 1 << max((memory * 2 ** 20 // slot).bit_length() - 1, 10)
+
+class SharedStore:
+    """
+    Open-addressing hash table (linear probing) of Q-values in shared memory,
+    inherited by the worker processes. Slots are claimed under the lock and never freed; values
+    are read without it, so a reader may see a row in the middle of a merge (Hogwild-style).
+    """
+    def __init__(self, n_actions, capacity=2 ** 20, dtype=np.float32, max_load=0.75):
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.max_load = max_load
+        self.lock = multiprocessing.Lock()
+        self.raw = (multiprocessing.RawArray('q', capacity), # keys
+                    multiprocessing.RawArray(np.ctypeslib.as_ctypes_type(self.dtype), capacity * n_actions), # Q-values
+                    multiprocessing.RawArray('q', 1)) # claimed slots
+        self.attach()
+        self.keys[:] = EMPTY
+
+    def attach(self):
+        keys, q, count = self.raw
+        self.keys = np.frombuffer(keys, dtype=np.int64)
+        self.q = np.frombuffer(q, dtype=self.dtype).reshape(self.capacity, -1)
+        self.count = np.frombuffer(count, dtype=np.int64)
+
+    def __getstate__(self):
+        # only picklable while spawning workers (initargs), like the shared arrays themselves
+        return self.capacity, self.dtype, self.max_load, self.lock, self.raw
+
+    def __setstate__(self, state):
+        self.capacity, self.dtype, self.max_load, self.lock, self.raw = state
+        self.attach()
+
+    def __len__(self):
+        return int(self.count[0])
+
+    def find(self, key):
+        """:return: slot of key, -1 if it is not in the store"""
+        i = key % self.capacity
+        while True:
+            k = self.keys[i]
+            if k == key:
+                return i
+            if k == EMPTY:
+                return -1
+            i = (i + 1) % self.capacity
+
+    def insert(self, key):
+        """:return: slot of key, claimed if new; -1 if the store is full. Call with the lock held."""
+        i = key % self.capacity
+        while True:
+            k = self.keys[i]
+            if k == key:
+                return i
+            if k == EMPTY:
+                if self.count[0] >= self.max_load * self.capacity:
+                    return -1
+                self.count[0] += 1
+                self.keys[i] = key
+                return i
+            i = (i + 1) % self.capacity
+
+class SharedQTable(QTable):
+    """
+    A worker's QTable backed by a SharedStore: a state the worker meets for the first time starts
+    from the stored values (learned by any worker), and merge() publishes the local changes.
+    Visit counts stay local: summed over the workers they shrank the 1 / visits learning rate, and
+    workers stopped unlearning the walking loops they were caught in.
+    :param imports: False for a table that only publishes (its learner runs exactly as a single one)
+    """
+    def __init__(self, store, n_actions, capacity=1024, key=None, imports=True):
+        super().__init__(n_actions, capacity, store.q.dtype, key)
+        self.store = store
+        self.imports = imports
+        self.slots = np.full(capacity, EMPTY, dtype=np.int64) # row -> store slot
+        self.base_q = np.zeros_like(self.q) # values of each row as of the last merge (or import)
+
+    def find(self, state):
+        key = self.get_key(state)
+        row = self.ids.get(key)
+        if row is None and self.imports and self.store.find(key) != EMPTY:
+            row = self.intern(state)
+        return row
+
+    def intern(self, state):
+        key = self.get_key(state)
+        row = self.ids.get(key)
+        if row is None:
+            row = super().intern(state)
+            slot = self.store.find(key) if self.imports else EMPTY
+            if slot != EMPTY:
+                self.slots[row] = slot
+                self.q[row] = self.base_q[row] = self.store.q[slot]
+        return row
+
+    def grow(self):
+        n = len(self.q)
+        super().grow()
+        self.slots = np.concatenate([self.slots, np.full(n, EMPTY, dtype=np.int64)])
+        self.base_q = np.concatenate([self.base_q, np.zeros_like(self.base_q)])
+
+    def q_values(self, state):
+        row = self.find(state)
+        return [0.0] * self.q.shape[1] if row is None else self.q[row].tolist()
+
+    def unshared(self):
+        """:return: number of rows the store had no free slot for, learned by this worker only"""
+        return int(np.count_nonzero(self.slots[:len(self.ids)] == EMPTY))
+
+    def merge(self):
+        """Publishes the Q-values changed since the last merge to the store."""
+        n = len(self.ids)
+        store = self.store
+        with store.lock:
+            missing = np.flatnonzero(self.slots[:n] == EMPTY)
+            if len(missing):
+                keys = list(self.ids)
+                for row in missing.tolist():
+                    self.slots[row] = store.insert(keys[row])
+            # rows left without a slot (store full) stay local
+            rows = np.flatnonzero(self.slots[:n] != EMPTY)
+            slots = self.slots[rows]
+            # values this worker changed are written over the store's (the latest writer of a pair wins).
+            # The worker keeps its own values of states it already knows: reading back the others'
+            # values of the same pairs (or the larger of the two) trapped workers in loops
+            q = self.q[rows]
+            store.q[slots] = np.where(q != self.base_q[rows], q, store.q[slots])
+        self.base_q[:n] = self.q[:n]
+
+# store and stop event of a worker process, set by _init_worker
+_shared = None
+
+def _init_worker(store, stop):
+    global _shared
+    _shared = store, stop
+
+def _train(worker, init_state, episodes, seed, exploration, sync_every, options):
+    """
+    Trains one worker until it solves the level, runs out of episodes or is told to stop.
+    :return: dict describing the worker's run
+    """
+    store, stop = _shared
+    random.seed(seed)
+    np.random.seed(seed)
+    t0, c0 = perf_counter(), process_time()
+    learner = QLearner(init_state, exploration=exploration, **options)
+    # worker 0 only publishes, so it learns exactly as a single learner would: whatever the others
+    # import, the run needs no more of its episodes than the serial one
+    learner.q_table = SharedQTable(store, learner.q_table.q.shape[1], key=learner.q_table.key, imports=worker > 0)
+    done = 0
+    n, actions = 0, []
+    while done < episodes and not stop.is_set():
+        n, actions = learner.learn(min(sync_every, episodes - done), display=False, stop=stop)
+        done += learner.episodes
+        learner.q_table.merge()
+        if n > 0:
+            stop.set()
+            break
+    t1, c1 = perf_counter(), process_time()
+    return {'worker': worker, 'seed': seed, 'exploration': exploration, 'episodes': done, 'steps': learner.t - 1,
+            'solved': n > 0, 'solution_length': n, 'solution': actions, 'time_ms': (t1 - t0) * 1000,
+            'cpu_ms': (c1 - c0) * 1000,
+            'unshared_states': learner.q_table.unshared()}
+
+def learn_parallel(init_state, workers, episodes=1000, seed=0, explorations=None, sync_every=1,
+                   capacity=None, store_memory=STORE_MEMORY, **options):
+    """
+    Trains workers QLearners on init_state in parallel until the first one solves it.
+    :param explorations: exploration rate of each worker (QLearner exploration); by default worker i
+        uses i / workers. Worker 0 never imports stored values, so with the default 0 it follows the
+        deterministic UCB policy of a single learner, and the others start new states from its values
+    :param sync_every: episodes between merges of a worker's Q-table with the shared store
+    :param capacity: slots of the shared store; by default as many as fit in store_memory MB for the level's
+        number of actions. States beyond 3/4 of it are only learned locally (reported per worker as
+        unshared_states, with a warning)
+    :param store_memory: MB of shared memory the store may take when capacity is not given
+    :param options: keyword arguments of QLearner
+    :return: (solution length, solution, list of the per-worker result dicts in completion order);
+        the solution is the first one found (0, [] if no worker solved the level)
+    """
+    explorations = [i / workers for i in range(workers)] if explorations is None else explorations
+    # the per-level tables are built once here rather than in every worker
+    if options.get('distance_table') is None:
+        options['distance_table'] = heuristics.get_distance_table(init_state)
+    if options.get('push_distance') and options.get('push_table') is None:
+        options['push_table'] = heuristics.get_push_distance_table(init_state)
+    if options.get('engine') == 'macro':
+        n_actions = macro.n_actions(compact.from_state(init_state))
+    else:
+        n_actions = len(environment.actions)
+
+    store = SharedStore(n_actions, capacity or store_capacity(n_actions, store_memory))
+    stop = multiprocessing.Event()
+    results = []
+    n, actions = 0, []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(store, stop)) as executor:
+        futures = [executor.submit(_train, i, init_state, episodes, seed + i, explorations[i], sync_every, options)
+                   for i in range(workers)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['solved'] and n == 0:
+                n, actions = result['solution_length'], result['solution']
+                stop.set()
+    unshared = sum(r['unshared_states'] for r in results)
+    if unshared:
+        warnings.warn(f"shared Q-table full ({len(store)} of {store.capacity} slots): workers kept {unshared} states "
+                      f"to themselves; raise store_memory (--store-memory)")
+    return n, actions, results
@@ -0,0 +1,74 @@
+import csv
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from types import SimpleNamespace
+
+class Profiler:
+    """
+    Opt-in per-phase timers, counters and per-episode records for QLearner.learn.
+    Instrumentation is installed by wrapping the hot functions once, so a learner built
+    without a profiler runs the plain functions with no overhead.
+    Phase times are inclusive: select_action contains the transitions it evaluates, which
+    contain the engine's get_transitions (step, reward, goal and deadlock calls, made separately
+    while profiling) and heuristic calls.
+    """
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.episodes = []
+        self.start = perf_counter()
+
+    def wrap(self, name, fn):
+        """:return: fn, timed under phase name"""
+        totals, calls = self.totals, self.calls
+
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                totals[name] += perf_counter() - t0
+                calls[name] += 1
+        return timed
+
+    def wrap_module(self, module, names):
+        """:return: namespace with every public attribute of module, the functions in names timed"""
+        namespace = SimpleNamespace(**{k: getattr(module, k) for k in dir(module) if not k.startswith('__')})
+        for name in names:
+            setattr(namespace, name, self.wrap(f"{module.__name__}.{name}", getattr(module, name)))
+        return namespace
+
+    @contextmanager
+    def phase(self, name):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += perf_counter() - t0
+            self.calls[name] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def record_episode(self, **fields):
+        self.episodes.append(fields)
+        self.count(f"outcome.{fields.get('outcome')}")
+
+    def summary(self, **extra):
+        wall = perf_counter() - self.start
+        phases = {name: {'calls': self.calls[name], 'total_s': total,
+                         'mean_us': total / self.calls[name] * 1e6 if self.calls[name] else 0.0,
+                         'share': total / wall if wall else 0.0}
+                  for name, total in sorted(self.totals.items(), key=lambda x: -x[1])}
+        return {'wall_s': wall, 'phases': phases, 'counters': dict(self.counters), **extra}
+
+    def write_csv(self, path):
+        fields = list(self.episodes[0]) if self.episodes else []
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.episodes)
@@ -1,33 +1,216 @@
 import environment
+import compact
 import heuristics
+import macro
+import heapq
+import importlib
 import random
 import numpy as np
+from cache import LRUCache
 from copy import copy
+from dataclasses import dataclass
+from functools import partial
+from itertools import count
+from qtable import QTable
+from time import perf_counter
+
+# engine name -> module; imported on first use, so Numba is only loaded when accel is asked for
+ENGINES = {'array': 'environment', 'compact': 'compact', 'accel': 'accel', 'macro': 'macro'}
+
+def get_engine(name):
+    """:return: module implementing the named engine"""
+    return importlib.import_module(ENGINES[name])
+
+def get_transitions_separately(env, state):
+    """
+    :return: env.get_transitions(state), computed with separate feasibility, step, goal, deadlock and
+        reward calls through env (so a profiler's wrappers of them see every call)
+    """
+    result = []
+    for action in env.get_feasible_actions(state):
+        new_state = env.step(state, action)
+        goal = env.is_goal(new_state)
+        deadlock = not goal and env.is_deadlock(new_state, action)
+        reward = env.get_move_reward(state, action, new_state)
+        if goal:
+            reward += environment.BASIC_REWARD['GOAL']
+        elif deadlock:
+            reward += environment.BASIC_REWARD['DEADLOCK']
+        result.append((action, new_state, reward, goal, deadlock))
+    return result
+
+@dataclass(frozen=True)
+class Transition:
+    successor: object
+    reward: float
+    goal: bool
+    deadlock: bool
+    heuristic: float # heuristic value of the successor
 
 class QLearner:
-    def __init__(self, state) -> None:
-        self.state = state # initial state
-        self.q_table = {}
-        self.f_table = {}
+    def __init__(self, state, engine='array', push_distance=False, distance_table=None, push_table=None,
+                 transition_cache_size=2 ** 16, profiler=None, canonical=False, planning_steps=0,
+                 trace_decay=0.0, exploration=0.0) -> None:
+        # 'array' steps environment.State maps, 'compact' steps compact.CompactState keys,
+        # 'macro' learns over whole pushes of compact states (actions are ints, see macro.py)
+        self.env = get_engine(engine)
+        self.macro = engine == 'macro'
+        self.state = state if engine == 'array' else self.env.from_state(state) # initial state
+        if self.macro:
+            n_actions = macro.n_actions(self.state)
+            self.action_index = list(range(n_actions))
+        else:
+            n_actions = len(environment.actions)
+            self.action_index = environment.action_index
+        # canonical keys merge states that differ only in the actor's position within its region;
+        # only push actions are independent of that position, so only the macro engine allows it
+        if canonical and not self.macro:
+            raise ValueError("canonical state keys require engine='macro'")
+        self.canonical = canonical
+        self.q_table = QTable(n_actions, key=environment.canonical_key if canonical else None) # Q-values and visit counts
         self.discount_factor = 0.96
         self.learning_rate = 0.5
         self.epsilon = 0.1
+        # probability, relative to the decaying get_epsilon schedule, of a random action in place of
+        # the UCB choice while learning; 0 keeps learning deterministic
+        self.exploration = exploration
         self.t = 1 # total time step
+        self.episodes = 0 # episodes run by the last call to learn
+
+        # optional profiling.Profiler; when given, the hot paths are replaced by timed wrappers
+        self.profiler = profiler
+        get_distance_table, get_push_distance_table = heuristics.get_distance_table, heuristics.get_push_distance_table
+        if profiler is not None:
+            get_distance_table = profiler.wrap('distance_table', get_distance_table)
+            get_push_distance_table = profiler.wrap('push_distance_table', get_push_distance_table)
 
-        self.distance_table = heuristics.get_distance_table(self.state)
-        self.heuristics = [heuristics.EMMHeuristic(self.distance_table), heuristics.AgentBoxHeuristic(self.distance_table)]
+        # per-level tables can be passed in when several learners train on the same level
+        self.distance_table = get_distance_table(state) if distance_table is None else distance_table
+        # EMM matches boxes to targets by push distance instead of walking distance if enabled
+        self.push_table = None
+        if push_distance:
+            self.push_table = get_push_distance_table(state) if push_table is None else push_table
+        self.heuristics = [heuristics.EMMHeuristic(self.distance_table, self.push_table), heuristics.AgentBoxHeuristic(self.distance_table)]
         self.h_weight = [2, 1] # relative importance of heuristics
 
         self.max_episode_length = 1000
 
+        # state key -> {action: Transition}, shared by the lookahead in select_action and by learn
+        self.transitions = LRUCache(transition_cache_size)
+        self.feasible_actions = LRUCache(transition_cache_size) # state key -> feasible actions
+
+        # prioritized sweeping: the environment is a deterministic model, so after every real step up to
+        # planning_steps backups are replayed over observed transitions, largest TD error first
+        self.planning_steps = planning_steps
+        # smallest TD error worth a backup: step costs alone can't build errors this large (they add up to
+        # at most 10 / (1 - discount) = 250), so sweeps carry goal, deadlock and box-on-target values back
+        # through the model, and the visit-count driven exploration over walking moves is left alone
+        self.planning_threshold = 1000.0
+        # the model holds Q-table rows only, plus one state per row (bounded like the transition cache)
+        # to replay its transitions from; pairs whose state was evicted are no longer swept
+        self.predecessors = {} # Q-table row -> {(row, action): None} observed to lead to it, in insertion order
+        self.model_states = LRUCache(transition_cache_size) # Q-table row -> a state of that row
+        self.queue = [] # heap of (-priority, tie, row, action)
+        self.queued = {} # (row, action) -> priority of its live heap entry
+        self.tie = count()
+
+        # Watkins Q(lambda) with replacing traces; trace_decay (lambda) 0 is plain one-step Q-learning.
+        # Only traces above trace_threshold are kept, so at most log(threshold) / log(discount * lambda)
+        # pairs are updated per step however long the episode is
+        self.trace_decay = trace_decay
+        self.trace_threshold = 0.01
+        self.traces = {} # (Q-table row, action column) -> eligibility
+
+        if profiler is not None:
+            self.instrument(profiler)
+
+    def instrument(self, profiler):
+        name = self.env.__name__
+        self.env = profiler.wrap_module(self.env, ['step', 'get_feasible_actions', 'get_move_reward', 'is_goal', 'is_deadlock'])
+        # the engines' fused get_transitions calls step, reward and deadlock inside its module, past these
+        # wrappers, so a profiled learner expands states with the separate calls (same transitions)
+        self.env.get_transitions = profiler.wrap(f"{name}.get_transitions", partial(get_transitions_separately, self.env))
+        self.select_action = profiler.wrap('select_action', self.select_action)
+        self.transition = profiler.wrap('transition', self.transition)
+        self.update_q_value = profiler.wrap('update_q_value', self.update_q_value)
+        for h in self.heuristics:
+            h.heuristic = profiler.wrap(f"heuristic.{type(h).__name__}", h.heuristic)
+
+    def profile_summary(self):
+        """
+        :return: profiler summary with training totals, None if the learner was built without a profiler
+        """
+        if self.profiler is None:
+            return None
+        steps = self.t - 1
+        learn_s = self.profiler.totals['learn']
+        return self.profiler.summary(steps=steps, steps_per_sec=steps / learn_s if learn_s else 0.0,
+                                     states=len(self.q_table), q_table_bytes=self.q_table.nbytes(),
+                                     transition_cache=self.transitions.stats(),
+                                     matching_cache=self.heuristics[0].min_matcher.stats())
+
+    def save(self, path):
+        """
+        Checkpoints the Q-values, visit counts and time step to path (.npz, see QTable.save).
+        """
+        self.q_table.save(path, t=self.t, level=self.state.level.fingerprint(), macro=self.macro, canonical=self.canonical)
+
+    def load(self, path):
+        """
+        Resumes from (or warm-starts with) a checkpoint written by save for the same level.
+        The array and compact engines share state keys and actions, so either can load the other's.
+        """
+        q_table, metadata = QTable.load(path, self.q_table.key)
+        if metadata['level'] != self.state.level.fingerprint():
+            raise ValueError(f"checkpoint {path} was saved for a different level")
+        if bool(metadata['macro']) != self.macro or bool(metadata['canonical']) != self.canonical:
+            raise ValueError(f"checkpoint {path} was saved with incompatible engine or state keys")
+        self.q_table = q_table
+        self.t = int(metadata['t'])
+
     def heuristic(self, state):
         h_val = 0
         for i, h in enumerate(self.heuristics):
             h_val += self.h_weight[i] * h.heuristic(state)
         return h_val
 
+    # with push distances, a box layout no matching can solve is a deadlock the environment rules miss
+    def is_push_deadlock(self, state):
+        return self.push_table is not None and self.heuristics[0].min_matcher.get_min_matching_cost(state) == np.inf
+
+    def get_transitions(self, state):
+        """
+        :return: dict of every feasible action of state to its Transition, computed together by the
+            engine's get_transitions once and then served from the cache
+        """
+        transitions = self.transitions.get(state.key)
+        if transitions is None:
+            transitions = {}
+            for action, new_state, reward, goal, deadlock in self.env.get_transitions(state):
+                if not goal and not deadlock and self.is_push_deadlock(new_state):
+                    deadlock = True
+                    reward += environment.BASIC_REWARD['DEADLOCK']
+                transitions[action] = Transition(new_state, reward, goal, deadlock, self.heuristic(new_state))
+            self.transitions.put(state.key, transitions)
+            self.feasible_actions.put(state.key, list(transitions))
+        return transitions
+
+    def transition(self, state, action):
+        """
+        :return: the Transition of taking the feasible action in state
+        """
+        return self.get_transitions(state)[action]
+
+    def get_feasible_actions(self, state):
+        feasible_actions = self.feasible_actions.get(state.key)
+        if feasible_actions is None:
+            feasible_actions = self.env.get_feasible_actions(state)
+            self.feasible_actions.put(state.key, feasible_actions)
+        return feasible_actions
+
     def select_action(self, state, greedy=False):
-        feasible_actions = environment.get_feasible_actions(state)
+        feasible_actions = self.get_feasible_actions(state)
+        q_vals = self.q_table.q_values(state)
         
         if greedy:
             epsilon = self.epsilon
@@ -40,25 +223,27 @@ class QLearner:
                 h = self.heuristic(state)
                 for a in feasible_actions:
                     delta = self.get_delta(state, a)
-                    s_a = environment.step(state, a)
-                    delta_h = 50 * (h - self.heuristic(s_a))
-                    val = (1 - delta) * self.get_q_value(state, a) + delta * delta_h
+                    delta_h = 50 * (h - self.transition(state, a).heuristic)
+                    val = (1 - delta) * q_vals[self.action_index[a]] + delta * delta_h
 
                     if val > max_val:
                         max_val = val
                         max_action = a
+        elif self.exploration and random.random() < self.exploration * self.epsilon:
+            return random.choice(feasible_actions)
         else:
             c = 1.5
             max_action = None
             max_val = -10e10
             h = self.heuristic(state)
+            visits = self.q_table.visits(state)
             for a in feasible_actions:
                 delta = self.get_delta(state, a)
-                s_a = environment.step(state, a)
-                delta_h = 20 * (h - self.heuristic(s_a))
-                ucb = self.get_q_value(state, a)
-                if self.get_state_action_frequency(state, a) > 0:
-                    ucb += c * np.sqrt(np.log(self.t) / self.get_state_action_frequency(state, a))
+                delta_h = 20 * (h - self.transition(state, a).heuristic)
+                ucb = q_vals[self.action_index[a]]
+                f = visits[self.action_index[a]]
+                if f > 0:
+                    ucb += c * np.sqrt(np.log(self.t) / f)
                 val = (1 - delta) * ucb + delta * delta_h
 
                 if val > max_val:
@@ -67,37 +252,91 @@ class QLearner:
         return max_action
 
 
+    def td_error(self, state, action):
+        transition = self.transition(state, action)
+        return abs(transition.reward + self.discount_factor * self.get_max_q(transition.successor) - self.get_q_value(state, action))
+
+    def prioritize(self, row, action):
+        state = self.model_states.get(row)
+        if state is None:
+            return
+        priority = self.td_error(state, action)
+        key = (row, action)
+        if priority > self.planning_threshold and priority > self.queued.get(key, 0):
+            self.queued[key] = priority
+            heapq.heappush(self.queue, (-priority, next(self.tie), row, action))
+
+    def sweep(self, state, action, new_state):
+        """
+        Records the real transition (already backed up by update_q_value) in the model, queues the
+        predecessors of its changed state, then runs up to planning_steps backups in order of priority,
+        queueing the predecessors of every backed-up state.
+        """
+        row = self.q_table.intern(state)
+        self.model_states.put(row, state)
+        self.predecessors.setdefault(self.q_table.intern(new_state), {})[(row, action)] = None
+        self.prioritize(row, action)
+        for p_row, p_action in self.predecessors.get(row, ()):
+            self.prioritize(p_row, p_action)
+        backups = 0
+        while self.queue and backups < self.planning_steps:
+            priority, _, r, a = heapq.heappop(self.queue)
+            # skip entries superseded by a higher priority push of the same pair
+            if self.queued.get((r, a)) != -priority:
+                continue
+            del self.queued[(r, a)]
+            s = self.model_states.get(r)
+            if s is None:
+                continue
+            transition = self.transition(s, a)
+            self.update_q_value(s, a, transition.successor, transition.reward)
+            backups += 1
+            for p_row, p_action in self.predecessors.get(r, ()):
+                self.prioritize(p_row, p_action)
+
+    def update_traces(self, state, action, new_state, reward):
+        """
+        Q(lambda) backup: the TD error of (state, action) updates every eligible pair, then traces decay.
+        """
+        delta = reward + self.discount_factor * self.get_max_q(new_state) - self.get_q_value(state, action)
+        self.traces[(self.q_table.intern(state), self.action_index[action])] = 1.0
+        decay = self.discount_factor * self.trace_decay
+        q, f = self.q_table.q, self.q_table.f
+        for (row, col), e in list(self.traces.items()):
+            q[row, col] += self.rate(f[row, col]) * delta * e
+            e *= decay
+            if e < self.trace_threshold:
+                del self.traces[(row, col)]
+            else:
+                self.traces[(row, col)] = e
+
     def update_q_value(self, state, action, new_state, reward):
         learning_rate = self.get_learning_rate(state, action)
         q_val = self.get_q_value(state, action)
         max_q = self.get_max_q(new_state)
         q_val += learning_rate * (reward + self.discount_factor * max_q - q_val)
-        self.q_table[(state, action)] = q_val
+        row = self.q_table.intern(state)
+        self.q_table.q[row, self.action_index[action]] = q_val
 
     def update_f_value(self, state, action):
-        if (state, action) in self.f_table:
-            self.f_table[(state, action)] += 1
-        else:
-            self.f_table[(state, action)] = 1
+        row = self.q_table.intern(state)
+        self.q_table.f[row, self.action_index[action]] += 1
 
     def get_max_q(self, state):
-        feasible_actions = environment.get_feasible_actions(state)
-        q_vals = [self.get_q_value(state, action) for action in feasible_actions]
-        return max(q_vals)
+        q_vals = self.q_table.q_values(state)
+        return max((q_vals[self.action_index[a]] for a in self.get_feasible_actions(state)), default=0)
 
     def get_q_value(self, state, action):
-        return self.q_table[(state, action)] if (state, action) in self.q_table else 0
+        row = self.q_table.find(state)
+        return 0 if row is None else float(self.q_table.q[row, self.action_index[action]])
 
     def get_state_action_frequency(self, state, action):
-        if (state, action) in self.f_table:
-            return self.f_table[(state, action)]
-        return 0
+        row = self.q_table.find(state)
+        return 0 if row is None else int(self.q_table.f[row, self.action_index[action]])
 
     def get_state_frequency(self, state):
-        f = 0
-        for a in environment.get_feasible_actions(state):
-            f += self.get_state_action_frequency(state, a)
-        return f
+        visits = self.q_table.visits(state)
+        return sum(visits[self.action_index[a]] for a in self.get_feasible_actions(state))
 
     def get_epsilon(self):
         return 1 / (self.t / 100 + 1)
@@ -107,52 +346,101 @@ class QLearner:
         return 1 / (self.t / 10 + 1)
 
     def get_learning_rate(self, state, action):
-        f = self.get_state_action_frequency(state, action)
+        return self.rate(self.get_state_action_frequency(state, action))
+
+    @staticmethod
+    def rate(f):
+        # learning rate after f visits of a state-action pair
         return 1 / (1.2 * (f/2 + 0.5))
 
-    def learn(self, episodes, display=True):
+    def learn(self, episodes, display=True, checkpoint=None, checkpoint_every=100, stop=None):
+        """
+        :param checkpoint: path the learner is saved to every checkpoint_every episodes and at the end
+        :param stop: object with is_set() (e.g. multiprocessing.Event), checked before every episode
+        """
+        if self.profiler is not None:
+            with self.profiler.phase('learn'):
+                result = self._learn(episodes, display, checkpoint, checkpoint_every, stop)
+        else:
+            result = self._learn(episodes, display, checkpoint, checkpoint_every, stop)
+        if checkpoint is not None:
+            self.save(checkpoint)
+        return result
+
+    def _learn(self, episodes, display, checkpoint=None, checkpoint_every=100, stop=None):
         shortest_solution = []
+        self.episodes = 0
 
         for i in range(episodes):
+            if stop is not None and stop.is_set():
+                break
+            self.episodes = i + 1
             state = copy(self.state)
+            transition = None
             goal_found = False
             deadlock = False
             states = []
             actions = []
             self.epsilon = self.get_epsilon()
             new_state_actions = 0
+            self.traces.clear()
+            t0 = perf_counter()
             for step in range(self.max_episode_length):
-                # exit if goal or deadlock is reached
-                if environment.is_goal(state):
-                    # update q-values of path if goal is reached
-                    if len(actions) < len(shortest_solution) or len(shortest_solution) == 0:
-                        shortest_solution = actions
+                # exit if goal or deadlock is reached (flags of the transition that led here)
+                if (transition.goal if transition else self.env.is_goal(state)):
+                    # update q-values of path if goal is reached; macro actions are whole pushes, so
+                    # solutions are compared by their primitive moves on every engine
+                    solution = macro.expand(self.state, actions) if self.macro else actions
+                    if len(solution) < len(shortest_solution) or len(shortest_solution) == 0:
+                        shortest_solution = solution
                     goal_found = True
                     break
-                elif len(actions) and environment.is_deadlock(state, actions[-1]):
+                elif transition and transition.deadlock:
                     # print(state.map)
                     deadlock = True
                     break
 
                 action = self.select_action(state)
+                # Watkins: traces only follow the greedy policy, an exploratory action cuts them
+                if self.traces and self.get_q_value(state, action) < self.get_max_q(state):
+                    self.traces.clear()
                 states.append(state)
                 actions.append(action)
                 
-                if (state, action) not in self.q_table:
+                if self.get_state_action_frequency(state, action) == 0:
                     new_state_actions += 1
 
-                new_state = environment.step(state, action)
-                reward = environment.get_reward(state, action, new_state)
+                transition = self.transition(state, action)
+                new_state = transition.successor
+                reward = transition.reward
 
                 self.update_f_value(state, action)
-                self.update_q_value(state, action, new_state, reward)
+                if self.trace_decay:
+                    # the push into a deadlock takes the whole penalty: the moves before it still had
+                    # other pushes available, and -DEADLOCK would swamp their values for good
+                    if transition.deadlock:
+                        self.traces.clear()
+                    self.update_traces(state, action, new_state, reward)
+                else:
+                    self.update_q_value(state, action, new_state, reward)
+                if self.planning_steps:
+                    self.sweep(state, action, new_state)
                 state = new_state
                 self.t += 1
+            if self.profiler is not None:
+                self.profiler.record_episode(episode=i + 1, length=len(actions),
+                                             outcome='goal' if goal_found else 'deadlock' if deadlock else 'timeout',
+                                             new_state_actions=new_state_actions, states=len(self.q_table),
+                                             time_s=perf_counter() - t0)
             if goal_found:
                 break
+            if checkpoint is not None and (i + 1) % checkpoint_every == 0:
+                self.save(checkpoint)
 
             if display:
                 print(f"Episode {i+1}, length={step}, deadlock={deadlock}, max_q={self.get_max_q(self.state)}, new_state_action_ratio={new_state_actions/step}")
         if display:
+            print(f"Matching cache: {self.heuristics[0].min_matcher.stats()}")
+            print(f"Transition cache: {self.transitions.stats()}")
             print(f"Shortest solution has length {len(shortest_solution)}: {shortest_solution}")
         return len(shortest_solution), shortest_solution
\ No newline at end of file
@@ -0,0 +1,82 @@
+import numpy as np
+import os
+
+class QTable:
+    """
+    Q-values and visit counts of every (state, action) pair, kept in growable (states x actions)
+    arrays. Each state is interned once to a row id through its hash key (state.key, or key(state)
+    if given, e.g. environment.canonical_key), so no state objects are kept alive by the table.
+    """
+    def __init__(self, n_actions, capacity=1024, dtype=np.float32, key=None):
+        self.key = key
+        self.ids = {} # state key -> row
+        self.q = np.zeros((capacity, n_actions), dtype=dtype)
+        self.f = np.zeros((capacity, n_actions), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, state):
+        """:return: row id of state, None if it was never interned"""
+        return self.ids.get(self.get_key(state))
+
+    def get_key(self, state):
+        return state.key if self.key is None else self.key(state)
+
+    def intern(self, state):
+        """:return: row id of state, allocating a zeroed row on first use"""
+        key = self.get_key(state)
+        row = self.ids.get(key)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.q):
+                self.grow()
+            self.ids[key] = row
+        return row
+
+    def grow(self):
+        capacity = 2 * len(self.q)
+        q = np.zeros((capacity, self.q.shape[1]), dtype=self.q.dtype)
+        f = np.zeros((capacity, self.f.shape[1]), dtype=self.f.dtype)
+        q[:len(self.q)] = self.q
+        f[:len(self.f)] = self.f
+        self.q, self.f = q, f
+
+    def q_values(self, state):
+        """:return: list of the Q-values of every action in state (zeros if unseen)"""
+        row = self.ids.get(self.get_key(state))
+        return [0.0] * self.q.shape[1] if row is None else self.q[row].tolist()
+
+    def visits(self, state):
+        """:return: list of the visit counts of every action in state (zeros if unseen)"""
+        row = self.ids.get(self.get_key(state))
+        return [0] * self.f.shape[1] if row is None else self.f[row].tolist()
+
+    def save(self, path, **metadata):
+        """
+        Writes the interned keys, Q-values and visit counts of the visited states to an .npz file,
+        atomically (temporary file, then rename), so an interrupted save keeps the previous file.
+        :param metadata: extra scalars stored alongside, returned by load
+        """
+        n = len(self.ids)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            # row ids are assigned in insertion order, so the keys come out sorted by row
+            np.savez(f, keys=np.fromiter(self.ids, dtype=np.int64, count=n), q=self.q[:n], f=self.f[:n], **metadata)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, key=None):
+        """:return: (QTable, dict of the metadata saved with it)"""
+        with np.load(path) as data:
+            keys, q, f = data['keys'], data['q'], data['f']
+            metadata = {name: data[name][()] for name in data.files if name not in ('keys', 'q', 'f')}
+        table = cls(q.shape[1], capacity=max(len(keys), 1), dtype=q.dtype, key=key)
+        table.ids = dict(zip(keys.tolist(), range(len(keys))))
+        table.q[:len(keys)] = q
+        table.f[:len(keys)] = f
+        return table, metadata
+
+    def nbytes(self):
+        n = len(self.ids)
+        return self.q[:n].nbytes + self.f[:n].nbytes
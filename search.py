@@ -0,0 +1,252 @@
+import compact
+import heuristics
+import heapq
+import numpy as np
+from itertools import count
+
+class Solver:
+    """
+    Classical search over the push-level (macro-move) graph: every edge walks the actor to a box
+    and pushes it once, costing the number of primitive moves. The heuristic is the EMM matching
+    over push distances, which never overestimates the remaining moves, so both searches return
+    solutions with the fewest primitive moves the deadlock rules allow.
+    With canonical=True the transposition tables are keyed on environment.canonical_key, merging
+    states that differ only in where the actor stands within its region: far fewer states are
+    stored and expanded, but solutions are no longer guaranteed to have the fewest moves.
+    """
+    def __init__(self, state, distance_table=None, push_table=None, canonical=False):
+        self.state = compact.from_state(state) # initial state
+        self.canonical = canonical
+        self.push_table = heuristics.get_push_distance_table(state) if push_table is None else push_table
+        self.min_matcher = heuristics.MinMatcher(distance_table, self.push_table)
+        self.expanded = 0 # states whose successors were generated
+        self.generated = 0 # successor states generated
+
+    def heuristic(self, state):
+        return self.min_matcher.get_min_matching_cost(state)
+
+    def key(self, state):
+        return compact.canonical_key(state) if self.canonical else state.key
+
+    def successors(self, state):
+        """
+        :return: list of (successor, primitive actions leading to it, (box, action) push),
+            skipping deadlocked successors
+        """
+        self.expanded += 1
+        tree = compact.walk(state)
+        if self.canonical:
+            compact.canonical_key(state, tree)
+        result = []
+        for box, action in compact.get_pushes(state, tree):
+            new_state = compact.push(state, box, action)
+            if compact.is_deadlock(new_state, action):
+                continue
+            moves = compact.walk_path(tree, box - state.level.moves[action]) + [action]
+            result.append((new_state, moves, (box, action)))
+        self.generated += len(result)
+        return result
+
+    def astar(self):
+        """
+        A* with a transposition table keyed on state hashes (see key).
+        :return: (solution length, list of primitive actions), (0, []) if there is no solution
+        """
+        start = self.state
+        h = self.heuristic(start)
+        if h == np.inf:
+            return 0, []
+        tie = count()
+        frontier = [(h, 0, next(tie), start)]
+        best_g = {self.key(start): 0}
+        parents = {self.key(start): None} # key -> (parent key, push from parent)
+
+        while frontier:
+            f, g, _, state = heapq.heappop(frontier)
+            if g > best_g[self.key(state)]:
+                continue
+            if compact.is_goal(state):
+                return self.reconstruct(parents, self.key(state))
+            for new_state, moves, push in self.successors(state):
+                new_g = g + len(moves)
+                new_key = self.key(new_state)
+                if new_g < best_g.get(new_key, np.inf):
+                    h = self.heuristic(new_state)
+                    if h == np.inf:
+                        continue
+                    best_g[new_key] = new_g
+                    parents[new_key] = (self.key(state), push)
+                    heapq.heappush(frontier, (new_g + h, new_g, next(tie), new_state))
+        return 0, []
+
+    def predecessors(self, state):
+        """
+        :return: list of (predecessor, (box, action) push leading from it to state) over pulls
+        """
+        self.expanded += 1
+        tree = compact.walk(state)
+        compact.canonical_key(state, tree)
+        result = [(compact.pull(state, box, action), (box - state.level.moves[action], action))
+                  for box, action in compact.get_pulls(state, tree)]
+        self.generated += len(result)
+        return result
+
+    def goal_states(self):
+        """
+        :return: one state with every box on a target per free region, the actor on its first cell
+        """
+        level = self.state.level
+        boxes = frozenset(level.target_cells)
+        states = []
+        covered = set()
+        for cell in range(level.size):
+            if level.is_floor(cell) and cell not in boxes and cell not in covered:
+                state = compact.CompactState(level, cell, boxes)
+                covered.update(compact.walk(state))
+                states.append(state)
+        return states
+
+    def bidirectional(self):
+        """
+        Best-first search forwards from the start over pushes and backwards from every goal layout
+        over pulls, expanding the side with the smaller frontier, until a state generated on one side
+        is in the other side's table. Both tables are keyed on canonical keys and both sides are
+        ordered by pushes so far plus an EMM matching: onto the targets going forwards, back onto
+        the initial box cells going backwards. The first meeting is returned, so solutions are
+        not guaranteed to be the shortest.
+        :return: (solution length, list of primitive actions), (0, []) if there is no solution
+        """
+        start = self.state
+        if compact.is_goal(start):
+            return 0, []
+        h = self.heuristic(start)
+        if h == np.inf:
+            return 0, []
+        # matching of the boxes onto their initial cells, by pushes from there
+        reverse = heuristics.MinMatcher(None, np.array([start.level.push_distances([b]) for b in sorted(start.boxes)]))
+        tie = count()
+        # per side: canonical key -> None for a root, else (key of the neighbour toward the root, push)
+        forward = {compact.canonical_key(start): None}
+        backward = {}
+        frontiers = ([(h, 0, next(tie), start)], [])
+        for goal in self.goal_states():
+            h = reverse.get_min_matching_cost(goal)
+            if h < np.inf:
+                backward[compact.canonical_key(goal)] = None
+                frontiers[1].append((h, 0, next(tie), goal))
+
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            _, g, _, state = heapq.heappop(frontiers[side])
+            key = compact.canonical_key(state)
+            if side == 0:
+                parents, others, heuristic = forward, backward, self.heuristic
+                neighbours = [(new_state, push) for new_state, _, push in self.successors(state)]
+            else:
+                parents, others, heuristic = backward, forward, reverse.get_min_matching_cost
+                neighbours = self.predecessors(state)
+            for new_state, push in neighbours:
+                new_key = compact.canonical_key(new_state)
+                if new_key in parents:
+                    continue
+                parents[new_key] = (key, push)
+                if new_key in others:
+                    return self.join(forward, backward, new_key)
+                h = heuristic(new_state)
+                if h < np.inf:
+                    heapq.heappush(frontiers[side], (g + 1 + h, g + 1, next(tie), new_state))
+        return 0, []
+
+    def join(self, forward, backward, key):
+        # pushes from the start to the meeting state, then on from it to the goal
+        pushes = []
+        k = key
+        while forward[k] is not None:
+            k, push = forward[k]
+            pushes.append(push)
+        pushes.reverse()
+        k = key
+        while backward[k] is not None:
+            k, push = backward[k]
+            pushes.append(push)
+        solution = compact.expand_pushes(self.state, pushes)
+        return len(solution), solution
+
+    def reconstruct(self, parents, key):
+        # pushes are replayed from the initial state, since with canonical keys the stored
+        # parent may have been reached with the actor elsewhere in its region
+        pushes = []
+        while parents[key] is not None:
+            key, push = parents[key]
+            pushes.append(push)
+        solution = compact.expand_pushes(self.state, pushes[::-1])
+        return len(solution), solution
+
+    def idastar(self):
+        """
+        IDA* with a per-iteration transposition table holding the smallest g each state was reached with.
+        :return: (solution length, list of primitive actions), (0, []) if there is no solution
+        """
+        start = self.state
+        bound = self.heuristic(start)
+        while bound < np.inf:
+            self.table = {}
+            path = []
+            t = self.bounded_search(start, 0, bound, path)
+            if t is True:
+                solution = [a for moves in path for a in moves]
+                return len(solution), solution
+            bound = t
+        return 0, []
+
+    def bounded_search(self, state, g, bound, path):
+        """
+        Depth-first search below bound, appending the actions of the solution to path. The search keeps
+        its own stack of the successors left to try at every depth, so deep solutions (one level per push)
+        do not run into Python's recursion limit.
+        :return: True if a solution was found, otherwise the smallest f above bound (inf if none)
+        """
+        successors = self.bounded_expand(state, g, bound)
+        if not isinstance(successors, list):
+            return successors
+        stack = [[iter(successors), g, np.inf]] # [successors left, g, smallest f above bound below them]
+        while stack:
+            frame = stack[-1]
+            successor = next(frame[0], None)
+            if successor is None:
+                stack.pop()
+                if not stack:
+                    return frame[2]
+                path.pop()
+                stack[-1][2] = min(stack[-1][2], frame[2])
+                continue
+            _, new_state, moves = successor
+            new_g = frame[1] + len(moves)
+            path.append(moves)
+            t = self.bounded_expand(new_state, new_g, bound)
+            if t is True:
+                return True
+            if isinstance(t, list):
+                stack.append([iter(t), new_g, np.inf])
+            else:
+                path.pop()
+                frame[2] = min(frame[2], t)
+
+    def bounded_expand(self, state, g, bound):
+        """
+        :return: True if state is a goal within bound, its f (or inf if it was already reached with
+            a smaller g) if it is not expanded, otherwise its successors as (h + moves, state, moves), best first
+        """
+        f = g + self.heuristic(state)
+        if f > bound:
+            return f
+        if compact.is_goal(state):
+            return True
+        key = self.key(state)
+        if self.table.get(key, np.inf) <= g:
+            return np.inf
+        self.table[key] = g
+
+        successors = [(self.heuristic(s) + len(moves), s, moves) for s, moves, _ in self.successors(state)]
+        successors.sort(key=lambda x: x[0])
+        return successors
@@ -0,0 +1,168 @@
+import environment
+import gc
+import json
+import os
+import random
+import resource
+import signal
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from qlearning import QLearner
+from search import Solver
+from time import perf_counter
+
+# Streaming batch mode: levels are read lazily from files holding any number of levels in the
+# 5-line format of State.from_config, solved one per task in a process pool under per-level
+# time and memory budgets, and reported as one JSON line each as soon as they finish.
+
+class BudgetExceeded(Exception):
+    pass
+
+def read_levels(paths):
+    """
+    :param paths: level files and/or directories (every *.txt file inside, in name order)
+    :return: generator of (name, config text) with name "<file>:<index of the level in the file>"
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.txt'))
+        else:
+            files = [path]
+        for file in files:
+            with open(file, 'r') as f:
+                lines = []
+                index = 0
+                for line in f:
+                    # blank lines may separate levels
+                    if not line.strip():
+                        continue
+                    lines.append(line.strip())
+                    if len(lines) == 5:
+                        index += 1
+                        yield f"{file}:{index}", "\n".join(lines)
+                        lines = []
+
+def address_space():
+    """:return: bytes of virtual memory this process maps (0 where /proc is not available)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        return 0
+
+def _timeout(signum, frame):
+    raise BudgetExceeded('time')
+
+def solve_level(name, config, solver='qlearning', episodes=1000, engine='array', push_distance=False,
+                seed=0, time_limit=None, memory_limit=None):
+    """
+    Solves one level inside a pool worker. Every table is built and dropped here, so the worker
+    holds nothing from one level to the next.
+    :param time_limit: seconds before the level is abandoned (None: unlimited)
+    :param memory_limit: MB of address space the level may add to what the worker already maps (the
+        interpreter, NumPy, Numba, ...); enforced with RLIMIT_AS on the whole worker process while the
+        level runs (None: unlimited)
+    :return: dict describing the result; status is solved, unsolved, timeout, memory or error
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    old_limit = resource.getrlimit(resource.RLIMIT_AS)
+    if memory_limit is not None:
+        limit = address_space() + memory_limit * 2 ** 20
+        if old_limit[1] != resource.RLIM_INFINITY:
+            limit = min(limit, old_limit[1])
+        resource.setrlimit(resource.RLIMIT_AS, (limit, old_limit[1]))
+    if time_limit is not None:
+        signal.signal(signal.SIGALRM, _timeout)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+
+    result = {'level': name, 'solver': solver, 'status': 'unsolved', 'solution_length': 0, 'solution': ''}
+    t0 = perf_counter()
+    try:
+        init_state = environment.State.from_config(config)
+        if solver == 'qlearning':
+            n, actions = QLearner(init_state, engine=engine, push_distance=push_distance).learn(episodes, display=False)
+        else:
+            n, actions = getattr(Solver(init_state), solver)()
+        if n > 0:
+            result.update(status='solved', solution_length=n, solution=' '.join(a[0] for a in actions))
+    except BudgetExceeded:
+        result['status'] = 'timeout'
+    except MemoryError:
+        result['status'] = 'memory'
+    except SystemError as e:
+        # some C extensions report a failed allocation under RLIMIT_AS as a bare SystemError
+        result.update(status='memory' if memory_limit is not None else 'error', error=f"{type(e).__name__}: {e}")
+    except Exception as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    finally:
+        if time_limit is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        # the worker goes on to other levels
+        if memory_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, old_limit)
+    result['time_ms'] = (perf_counter() - t0) * 1000
+    gc.collect()
+    return result
+
+def run_stream(paths, output, workers=None, **options):
+    """
+    Solves every level of paths across a process pool, writing one JSON line per level to output
+    in completion order. At most 2 * workers levels are read ahead, so memory stays bounded
+    however many levels the input holds.
+    A worker killed while solving (e.g. by the OS when out of memory) breaks the pool and every
+    level in flight with it: the pool is replaced and those levels are solved again one at a time,
+    so that only the level that kills its worker on its own is reported as an error.
+    :param options: keyword arguments of solve_level
+    :return: dict with the number of levels per status
+    """
+    workers = workers or os.cpu_count()
+    levels = read_levels(paths)
+    counts = {}
+    suspects = deque() # levels in flight when a worker died, rerun alone
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = {} # future -> (level name, config, whether it runs alone)
+        exhausted = False
+        while pending or suspects or not exhausted:
+            if suspects:
+                if not pending:
+                    level = suspects.popleft()
+                    pending[executor.submit(solve_level, *level, **options)] = level + (True,)
+            else:
+                while not exhausted and len(pending) < 2 * workers:
+                    level = next(levels, None)
+                    if level is None:
+                        exhausted = True
+                    else:
+                        pending[executor.submit(solve_level, *level, **options)] = level + (False,)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                name, config, alone = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    if not alone:
+                        suspects.append((name, config))
+                        continue
+                    result = {'level': name, 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+                except Exception as e:
+                    result = {'level': name, 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+                counts[result['status']] = counts.get(result['status'], 0) + 1
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+            if broken:
+                # the broken pool fails every future it still holds
+                suspects.extend(level[:2] for level in pending.values())
+                pending.clear()
+                executor.shutdown(wait=True)
+                executor = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        executor.shutdown(wait=True)
+    return counts
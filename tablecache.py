@@ -0,0 +1,64 @@
+import heuristics
+import numpy as np
+import os
+import tempfile
+
+# bump when a cached table changes meaning or layout; old entries are then never read again
+VERSION = 1
+
+class TableCache:
+    """
+    Content-addressed on-disk cache of per-level tables. Entries are .npy files named after the
+    level fingerprint (a hash of dimensions, walls and targets) and VERSION, loaded memory-mapped read-only,
+    so processes working on the same level share one copy through the page cache. Files are written
+    to a temporary name and renamed into place, so concurrent processes never see a partial table;
+    when several build the same entry at once, the last identical copy wins.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, level, name):
+        return os.path.join(self.directory, f"{level.fingerprint()}-v{VERSION}-{name}.npy")
+
+    def get(self, state, name, build):
+        """
+        :param build: function of state computing the table on a miss
+        :return: the table called name of the level of state, read-only
+        """
+        path = self.path(state.level, name)
+        try:
+            table = np.load(path, mmap_mode='r')
+            self.hits += 1
+        except (FileNotFoundError, ValueError, OSError):
+            # missing or unreadable: rebuild
+            table = build(state)
+            self.write(path, table)
+            self.misses += 1
+            table = np.load(path, mmap_mode='r')
+        # plain read-only ndarray view of the mapping, without the np.memmap subclass overhead
+        return np.asarray(table)
+
+    def write(self, path, table):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, table)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get_distance_table(self, state):
+        return self.get(state, 'distance', heuristics.get_distance_table)
+
+    def get_push_distance_table(self, state):
+        return self.get(state, 'push-distance', heuristics.get_push_distance_table)
+
+    def clear(self):
+        """Deletes every cached table."""
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                os.unlink(os.path.join(self.directory, name))
@@ -0,0 +1,60 @@
+import batch
+import compact
+import environment
+import random
+import numpy as np
+import pytest
+from environment import BASIC_REWARD
+
+STATES = 500
+def random_states(init_state, n, rng, length=60):
+    # states along random walks that go on through deadlocks, so deadlocked layouts are drawn too
+    start = compact.from_state(init_state)
+    states = []
+    while len(states) < n:
+        state = start
+        for _ in range(rng.randrange(length)):
+            state = compact.step(state, rng.choice(compact.get_feasible_actions(state)))
+        states.append(state)
+    return states
+
+def test_batch_step_matches_scalar(init_state):
+    rng = random.Random(0)
+    states = random_states(init_state, STATES, rng)
+    # any action, feasible or not
+    action = np.array([rng.randrange(len(batch.directions)) for _ in states])
+    new_batch, reward, done, deadlock = batch.batch_step(batch.BatchState.from_states(states), action)
+    goal = batch.is_goal(new_batch)
+    feasible = 0
+    for i, (state, a) in enumerate(zip(states, action.tolist())):
+        name = batch.directions[a]
+        successor = new_batch.to_state(i)
+        if compact.is_feasible_action(state, name):
+            feasible += 1
+            expected = compact.step(state, name)
+        else:
+            # an infeasible action leaves the state unchanged (and earns the INFEASIBLE move reward)
+            expected = state
+            assert batch.get_move_reward(batch.BatchState.from_states([state]), np.array([a]))[0] == \
+                BASIC_REWARD['INFEASIBLE']
+        expected_goal = compact.is_goal(expected)
+        expected_deadlock = not expected_goal and compact.is_deadlock(expected, name)
+        assert (successor.actor, successor.boxes, successor.key) == (expected.actor, expected.boxes, expected.key)
+        assert reward[i] == compact.get_reward(state, name, expected)
+        assert goal[i] == expected_goal
+        assert deadlock[i] == expected_deadlock
+        assert done[i] == (expected_goal or expected_deadlock)
+    assert feasible > 0
+
+def test_random_rollouts(init_state):
+    final, total, moves, solved = batch.random_rollouts(init_state, 64, 50, np.random.default_rng(0))
+    for i in range(len(final)):
+        state = final.to_state(i)
+        assert solved[i] == compact.is_goal(state)
+        assert 1 <= moves[i] <= 50
+        # the total carries the goal reward of a solved rollout and the deadlock penalty of one that
+        # stopped early without solving the level
+        if solved[i]:
+            assert total[i] > BASIC_REWARD['GOAL'] / 2
+        elif moves[i] < 50:
+            assert total[i] < BASIC_REWARD['DEADLOCK'] / 2
@@ -0,0 +1,75 @@
+import accel
+import compact
+import environment
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import pytest
+
+WALKS = 10
+LENGTH = 100
+def accel_fallback():
+    # a separate copy of accel imported as if Numba were missing (JIT False: compact's functions)
+    saved = sys.modules.get('numba')
+    sys.modules['numba'] = None
+    try:
+        module = importlib.util.module_from_spec(importlib.util.find_spec('accel'))
+        module.__spec__.loader.exec_module(module)
+    finally:
+        if saved is None:
+            del sys.modules['numba']
+        else:
+            sys.modules['numba'] = saved
+    assert not module.JIT and module.step is compact.step
+    return module
+
+@pytest.fixture(scope="module", params=["compact", "accel", "accel-fallback"])
+def engine(request):
+    if request.param == "compact":
+        return compact
+    if request.param == "accel":
+        if not accel.JIT:
+            pytest.skip("numba is not installed")
+        return accel
+    return accel_fallback()
+
+def same_state(state, reference):
+    return (state.key == reference.key and state.actor_cell == reference.actor_cell
+            and sorted(state.box_cells) == sorted(reference.box_cells))
+
+def test_engine_matches_environment(engine, init_state):
+    rng = random.Random(0)
+    start = engine.from_state(init_state)
+    for _ in range(WALKS):
+        reference, state = init_state, start
+        for _ in range(LENGTH):
+            actions = environment.get_feasible_actions(reference)
+            assert engine.get_feasible_actions(state) == actions
+            assert engine.is_goal(state) == environment.is_goal(reference)
+            for action in environment.actions:
+                assert engine.is_deadlock(state, action) == environment.is_deadlock(reference, action)
+            transitions = engine.get_transitions(state)
+            expected = environment.get_transitions(reference)
+            assert [t[0] for t in transitions] == [t[0] for t in expected]
+            for (_, successor, reward, goal, deadlock), (action, ref_successor, ref_reward, ref_goal, ref_deadlock) \
+                    in zip(transitions, expected):
+                new_state = engine.step(state, action)
+                assert same_state(new_state, ref_successor) and same_state(successor, ref_successor)
+                assert engine.get_reward(state, action, new_state) == ref_reward == reward
+                assert engine.is_goal(new_state) == ref_goal == goal
+                assert (not goal and engine.is_deadlock(new_state, action)) == ref_deadlock == deadlock
+            if environment.is_goal(reference):
+                break
+            # walks go on through deadlocks, so deadlocked layouts are compared too
+            action = rng.choice(actions)
+            reference, state = environment.step(reference, action), engine.step(state, action)
+
+def test_numba_only_loaded_for_accel():
+    # a subprocess, since this one has already imported accel
+    code = ("import sys, main, benchmark, parallel, stream, qlearning\n"
+            "assert 'numba' not in sys.modules\n"
+            "qlearning.QLearner(benchmark.load_level(sys.argv[1]), engine='compact')\n"
+            "assert 'numba' not in sys.modules\n")
+    subprocess.run([sys.executable, "-c", code, "sokoban-01.txt"], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,28 @@
+import parallel
+import random
+import numpy as np
+import pytest
+from qlearning import QLearner
+
+def test_store_capacity():
+    # keys and float32 Q-values of 4 (primitive) or 80 (macro) actions in 64 MB
+    assert parallel.store_capacity(4) == 2 ** 21
+    assert parallel.store_capacity(80) == 2 ** 17
+    assert parallel.store_capacity(80, memory=1024) == 2 ** 21
+
+@pytest.mark.parametrize("init_state", ["sokoban-01.txt"], indirect=True)
+def test_one_worker_learns_as_a_single_learner(init_state):
+    # worker 0 only publishes to the store, so it runs exactly as QLearner does on its own
+    n, actions, results = parallel.learn_parallel(init_state, 1, 100, seed=0, engine='compact')
+    random.seed(0)
+    np.random.seed(0)
+    learner = QLearner(init_state, engine='compact')
+    assert (n, actions) == learner.learn(100, display=False)
+    assert results[0]['episodes'] == learner.episodes
+
+@pytest.mark.parametrize("init_state", ["sokoban-04.txt"], indirect=True)
+def test_full_store_is_reported(init_state):
+    with pytest.warns(UserWarning, match="shared Q-table full"):
+        n, actions, results = parallel.learn_parallel(init_state, 2, 1000, capacity=1024)
+    assert len(results) == 2
+    assert all(r['unshared_states'] > 0 for r in results)
@@ -0,0 +1,19 @@
+import random
+import pytest
+from profiling import Profiler
+from qlearning import QLearner
+
+@pytest.mark.parametrize("init_state", ["sokoban-01.txt"], indirect=True)
+@pytest.mark.parametrize("engine", ["array", "compact", "macro"])
+def test_profile_reports_engine_phases(init_state, engine):
+    runs = []
+    for profiler in (None, Profiler()):
+        random.seed(0)
+        learner = QLearner(init_state, engine=engine, profiler=profiler)
+        runs.append(learner.learn(100, display=False))
+    # profiling times the separate engine calls without changing what the learner does
+    assert runs[0] == runs[1]
+    phases = learner.profile_summary()['phases']
+    module = learner.env.step.__wrapped__.__module__
+    for name in ['get_transitions', 'step', 'get_move_reward', 'is_goal', 'is_deadlock']:
+        assert phases[f"{module}.{name}"]['calls'] > 0
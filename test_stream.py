@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import resource
+import stream
+
+LEVEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sokoban-01.txt")
+solve_level = stream.solve_level
+
+def crash_on_second(name, config, **options):
+    # stands in for a level whose worker gets killed by the OS
+    if name.endswith(':2'):
+        os._exit(1)
+    return solve_level(name, config, **options)
+
+def test_dead_worker_only_fails_its_level(tmp_path, monkeypatch):
+    with open(LEVEL, 'r') as f:
+        config = f.read().strip()
+    path = tmp_path / "levels.txt"
+    path.write_text("\n\n".join([config] * 6) + "\n")
+    monkeypatch.setattr(stream, 'solve_level', crash_on_second)
+    output = io.StringIO()
+    counts = stream.run_stream([str(path)], output, workers=2, solver='astar')
+    results = {r['level']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert counts == {'solved': 5, 'error': 1}
+    assert sorted(results) == sorted(f"{path}:{i}" for i in range(1, 7))
+    assert results[f"{path}:2"]['status'] == 'error'
+    assert 'BrokenProcessPool' in results[f"{path}:2"]['error']
+
+class GreedySolver:
+    # stands in for a solver that needs twice the memory budget of test_memory_limit
+    def __init__(self, state):
+        pass
+
+    def astar(self):
+        bytearray(2 * BUDGET * 2 ** 20)
+        return 0, []
+
+BUDGET = 64
+
+def test_memory_limit(monkeypatch):
+    with open(LEVEL, 'r') as f:
+        config = f.read()
+    before = resource.getrlimit(resource.RLIMIT_AS)
+    # the budget comes on top of the address space the process already maps, so a budget well
+    # below it is enough for a real level
+    assert stream.address_space() > BUDGET * 2 ** 20
+    assert stream.solve_level('a', config, solver='astar', memory_limit=BUDGET)['status'] == 'solved'
+    assert resource.getrlimit(resource.RLIMIT_AS) == before
+    monkeypatch.setattr(stream, 'Solver', GreedySolver)
+    assert stream.solve_level('b', config, solver='astar', memory_limit=BUDGET)['status'] == 'memory'
+    assert resource.getrlimit(resource.RLIMIT_AS) == before
@@ -0,0 +1,43 @@
+import accel
+import compact
+import environment
+import random
+import pytest
+from environment import zobrist_hash
+
+WALKS = 20
+LENGTH = 100
+@pytest.mark.parametrize("engine", [environment, compact, accel], ids=lambda e: e.__name__)
+def test_step_keeps_key(init_state, engine):
+    # the key updated incrementally by step always equals the hash computed from scratch
+    rng = random.Random(0)
+    start = init_state if engine is environment else engine.from_state(init_state)
+    assert start.key == zobrist_hash(start)
+    pushes = 0
+    for _ in range(WALKS):
+        state = start
+        for _ in range(LENGTH):
+            action = rng.choice(engine.get_feasible_actions(state))
+            new_state = engine.step(state, action)
+            assert new_state.key == zobrist_hash(new_state)
+            pushes += sorted(new_state.box_cells) != sorted(state.box_cells)
+            state = new_state
+    assert pushes > 0
+
+def test_push_and_pull_keep_key(init_state):
+    rng = random.Random(0)
+    start = compact.from_state(init_state)
+    for _ in range(WALKS):
+        state = start
+        for _ in range(LENGTH // 10):
+            pushes = compact.get_pushes(state)
+            if not pushes:
+                break
+            box, action = rng.choice(pushes)
+            new_state = compact.push(state, box, action)
+            assert new_state.key == zobrist_hash(new_state)
+            # pulling the box back restores the position before the push, actor standing behind it
+            back = compact.pull(new_state, box + state.level.moves[action], action)
+            assert back.key == zobrist_hash(back)
+            assert back.boxes == state.boxes
+            state = new_state